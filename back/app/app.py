@@ -1,36 +1,82 @@
+import hashlib
+import json
 from datetime import datetime
 from typing import List, Optional
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
  
-from fastapi import Depends, FastAPI, HTTPException, status, Body
+from fastapi import Depends, FastAPI, HTTPException, status, Body, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasic, HTTPBasicCredentials
 from passlib.context import CryptContext
 from pydantic import BaseModel
+from sqlalchemy import and_, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, relationship, sessionmaker
 
 from app.db import *
 from app.models import *
+from app.scheduler import FairScheduler
+from app.tokens import create_access_token, tokens_enabled, verify_access_token
 from asyncio import sleep as asleep
 
-# from ml.graph import quest_model, state, startup
+from ml.graph import astream_model, speculation, startup
+from ml.chat_state import new_state
+from ml.checkpoint import PostgresCheckpointSaver
+from ml.answer_cache import AnswerCache
+from ml.dataset import dataset_version
+from ml.fetcher import fetcher
+from ml.http_cache import http_cache
+from ml.pdf import pdf_extractor
+from ml.municipalities import municipality_index
+from ml.retrieval import retrieval_index
+from ml.schema import schema_digest
+from ml.sql_cache import sql_result_cache
+from ml.sql_guard import sql_guard
+from ml.templates import sql_templates
 
 # -----------------------------
 # 5) Зависимости
 # -----------------------------
 
  
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    return (await db.execute(select(User).where(User.username == username))).scalar_one_or_none()
+
+
+async def get_user_chat(db: AsyncSession, session_id: int, user_id: int) -> Optional[ChatSession]:
+    """
+    Чат session_id, если он принадлежит пользователю user_id, иначе None.
+    """
+    return (await db.execute(
+        select(ChatSession).where(ChatSession.id == session_id, ChatSession.user_id == user_id)
+    )).scalar_one_or_none()
+
  
-def get_current_user(
-    credentials: HTTPBasicCredentials = Depends(security),
-    db: Session = Depends(get_db),
+async def get_current_user(
+    token: Optional[HTTPAuthorizationCredentials] = Depends(bearer),
+    credentials: Optional[HTTPBasicCredentials] = Depends(optional_basic),
+    db: AsyncSession = Depends(get_async_db),
 ) -> User:
     """
-    HTTP Basic авторизация: отвечает User из базы, если имя/пароль корректны.
-    Иначе бросает HTTPException(401).
+    Авторизация по Bearer-токену из /api/login: проверка подписи без bcrypt.
+    Если токена нет — HTTP Basic, как раньше.
+    Отвечает User из базы, иначе бросает HTTPException(401).
     """
-    user = db.query(User).filter(User.username == credentials.username).first()
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    if token is not None:
+        user_id = verify_access_token(token.credentials)
+        user = await db.get(User, user_id) if user_id is not None else None
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Токен недействителен или истёк",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return user
+
+    user = None
+    if credentials is not None:
+        user = await get_user_by_username(db, credentials.username)
+    if not user or not await password_hasher.verify(credentials.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверное имя пользователя или пароль",
@@ -49,6 +95,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Иначе браузер не отдаст их скрипту (курсор и версия страницы /api/hist)
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
 async def fake_model_answers():
@@ -63,15 +111,117 @@ async def fake_model_answers():
     await asleep(1)
     yield "ГОЙДА!!!"
 
-async def real_model_answers(text):
-    yield text
-
 graph = None
+chat_graph = None
+quest_scheduler = FairScheduler(
+    max_concurrency=settings.QUEST_MAX_CONCURRENCY,
+    max_queue=settings.QUEST_MAX_QUEUE,
+    retry_after=settings.QUEST_RETRY_AFTER,
+)
+answer_cache = AnswerCache(
+    engine,
+    dataset_version,
+    max_size=settings.ANSWER_CACHE_SIZE,
+    ttl=settings.ANSWER_CACHE_TTL,
+    persistent=settings.ANSWER_CACHE_PERSISTENT,
+)
+
+
+async def load_chat_messages(session_id: int) -> list:
+    """
+    Загружает последние сообщения чата из таблицы messages в формате графа.
+    Нужна, когда у чата ещё нет чекпоинта (например, чат создан до их появления).
+    """
+    async with async_session_maker() as db:
+        rows = (await db.execute(
+            select(Message.role, Message.content)
+            .where(Message.session_id == session_id)
+            .order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(settings.CHAT_HISTORY_LIMIT)
+        )).all()
+    return [
+        {"role": "assistant" if role == "bot" else role, "content": content}
+        for role, content in reversed(rows)
+    ]
+
+
+async def save_chat_turn(session_id: int, question: str, answer: str) -> None:
+    """
+    Записывает вопрос пользователя и ответ бота одной транзакцией.
+    """
+    async with async_session_maker() as db:
+        db.add_all([
+            Message(session_id=session_id, role="user", content=question, timestamp=datetime.utcnow()),
+            Message(session_id=session_id, role="bot", content=answer, timestamp=datetime.utcnow()),
+        ])
+        await db.commit()
+
+
+async def remember_cached_turn(session_id: int, question: str, answer: str) -> None:
+    """
+    Дописывает ход, отвеченный из кэша, в чекпоинт чата,
+    чтобы следующий вопрос видел его в истории.
+    """
+    config = {"configurable": {"thread_id": str(session_id)}}
+    snapshot = await chat_graph.aget_state(config)
+    history = [] if snapshot.values else await load_chat_messages(session_id)
+    turn = [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+    await chat_graph.aupdate_state(config, {"messages": history + turn}, as_node="responder")
+
+
+async def chat_model_answers(text: str, session_id: Optional[int], user_id: int, cached: Optional[str] = None):
+    if cached is not None:
+        # Повторный вопрос: отдаём ответ сразу, граф не запускаем
+        yield cached
+        if session_id is not None:
+            await remember_cached_turn(session_id, text, cached)
+            await save_chat_turn(session_id, text, cached)
+        return
+
+    # Ждём слот планировщика: прогон графа — несколько вызовов LLM
+    async with quest_scheduler.slot(user_id):
+        if session_id is None:
+            # Вопрос вне чата — одноразовое состояние без чекпоинтов
+            state = new_state()
+            start = 0
+            async for token in astream_model(text, state, graph):
+                yield token
+        else:
+            config = {"configurable": {"thread_id": str(session_id)}}
+            snapshot = await chat_graph.aget_state(config)
+            history = [] if snapshot.values else await load_chat_messages(session_id)
+            state = new_state(history)
+            start = len(state["messages"])
+
+            async for token in astream_model(text, state, chat_graph, config):
+                yield token
+
+    # Ход завершился ответом — кэшируем его и сохраняем вопрос и ответ в messages.
+    # Отказ gate не кэшируем: случайный NO закрепился бы до перезагрузки данных
+    if len(state["messages"]) == start + 2:
+        answer = state["messages"][-1]["content"]
+        if state.get("access") == "YES":
+            await answer_cache.aput(text, answer)
+        if session_id is not None:
+            await save_chat_turn(session_id, text, answer)
+
 
 @app.on_event("startup")
 async def startup_event():
-    global graph
+    global graph, chat_graph
     graph = startup()
+    chat_graph = startup(checkpointer=PostgresCheckpointSaver(engine, keep=settings.CHECKPOINTS_KEEP))
+    # Дайджест схемы для NL2SQL собираем заранее, а не на первом вопросе
+    await schema_digest.aget()
+    await municipality_index.aload()
+    await retrieval_index.aload()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    password_hasher.shutdown()
+    await fetcher.aclose()
+    pdf_extractor.shutdown()
 
 
 @app.head("/")
@@ -84,20 +234,56 @@ async def test():
     return {"message": "test"}
 
 @app.post("/api/quest")
-async def question(q: Question):
-    # return StreamingResponse(test_model_answers(q.text))
+async def question(
+    q: Question,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # return StreamingResponse(fake_model_answers())
+
+    if q.session_id is not None:
+        session_obj = await get_user_chat(db, q.session_id, current_user.id)
+        if not session_obj:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Сессия чата не найдена или не принадлежит текущему пользователю",
+            )
+
+    cached = await answer_cache.aget(q.text)
+    if cached is None:
+        # Очередь полна — 429 до начала ответа
+        quest_scheduler.check()
 
-    answer = quest_model(q.text, state, graph)
-    return StreamingResponse(real_model_answers(quest_model(q.text, state, graph)))
+    return StreamingResponse(
+        chat_model_answers(q.text, q.session_id, current_user.id, cached),
+        media_type="text/plain; charset=utf-8",
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Метрики в текстовом формате Prometheus.
+    """
+    lines = [f"quest_scheduler_{name} {value}" for name, value in quest_scheduler.stats().items()]
+    lines += [f"answer_cache_{name} {value}" for name, value in answer_cache.stats().items()]
+    lines += [f"graph_speculation_{name} {value}" for name, value in speculation.stats().items()]
+    lines += [f"sql_cache_{name} {value}" for name, value in sql_result_cache.stats().items()]
+    lines += [f"sql_guard_{name} {value}" for name, value in sql_guard.stats().items()]
+    lines += [f"sql_templates_{name} {value}" for name, value in sql_templates.stats().items()]
+    lines += [f"retrieval_{name} {value}" for name, value in retrieval_index.stats().items()]
+    lines += [f"http_cache_{name} {value}" for name, value in http_cache.stats().items()]
+    lines += [f"fetcher_{name} {value}" for name, value in fetcher.stats().items()]
+    return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
 
 
 @app.post("/api/register", status_code=status.HTTP_201_CREATED)
-def register_user(request: RegisterRequest, db: Session = Depends(get_db)):
+async def register_user(request: RegisterRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Регистрация нового пользователя.
     Если username уже занят, возвращаем ошибку 400.
     """
-    existing = db.query(User).filter(User.username == request.username).first()
+    existing = await get_user_by_username(db, request.username)
     if existing:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -105,45 +291,43 @@ def register_user(request: RegisterRequest, db: Session = Depends(get_db)):
         )
     user = User(
         username=request.username,
-        hashed_password=get_password_hash(request.password),
+        hashed_password=await password_hasher.hash(request.password),
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
     return {"detail": "Пользователь успешно зарегистрирован"}
  
  
 @app.post("/api/login")
-def login(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
+async def login(credentials: HTTPBasicCredentials = Depends(security), db: AsyncSession = Depends(get_async_db)):
     """
     Проверяет переданные HTTP Basic креденшелы.
-    При успехе возвращает подтверждение.
+    При успехе возвращает подтверждение и короткоживущий токен доступа
+    для заголовка Authorization: Bearer <token> (если задан SECRET_KEY).
     """
-    print("--- Credentials ---")
-    print(credentials.username)
-    print(credentials.password)
-    
-    user = db.query(User).filter(User.username == credentials.username).first()
-
-    print("--- DB ---")
-    print(user.username)
-    print(user.hashed_password)
-    print("succes:", verify_password(credentials.password, user.hashed_password))
+    user = await get_user_by_username(db, credentials.username)
 
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    if not user or not await password_hasher.verify(credentials.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверное имя пользователя или пароль",
             headers={"WWW-Authenticate": "Basic"},
         )
-    return {"detail": f"Пользователь {user.username} успешно аутентифицирован"}
+    answer = {"detail": f"Пользователь {user.username} успешно аутентифицирован"}
+    if tokens_enabled():
+        answer.update(
+            access_token=create_access_token(user.id),
+            token_type="bearer",
+            expires_in=settings.ACCESS_TOKEN_TTL,
+        )
+    return answer
  
  
 @app.post("/api/hist-create")
-def create_chat_session(
+async def create_chat_session(
     hc: Annotated[HistCreate, Body()],
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Создаёт новую сессию чата для текущего (аутентифицированного) пользователя.
@@ -151,8 +335,7 @@ def create_chat_session(
     """
     new_session = ChatSession(user_id=current_user.id, title=hc.title)
     db.add(new_session)
-    db.commit()
-    db.refresh(new_session)
+    await db.commit()
 
     return {
         "chat": {
@@ -171,49 +354,105 @@ Chat
     user_email
 """
 
+async def stream_chat_history(user_id: int, username: str, chat_ids: list, messages_limit: Optional[int]):
+    """
+    Стримит JSON-массив чатов одной выборкой: для каждого чата из chat_ids
+    берутся не больше messages_limit последних сообщений (оконная функция),
+    без messages_limit — все сообщения.
+    """
+    ranked = (
+        select(
+            Message.session_id,
+            Message.id,
+            Message.role,
+            Message.content,
+            Message.timestamp,
+            func.row_number().over(
+                partition_by=Message.session_id,
+                order_by=(Message.timestamp.desc(), Message.id.desc()),
+            ).label("rn"),
+        )
+        .where(Message.session_id.in_(chat_ids))
+        .subquery()
+    )
+    join = ranked.c.session_id == ChatSession.id
+    if messages_limit is not None:
+        join = and_(join, ranked.c.rn <= messages_limit)
+    query = (
+        select(ChatSession.id, ChatSession.title, ranked.c.role, ranked.c.content)
+        .outerjoin(ranked, join)
+        .where(ChatSession.id.in_(chat_ids), ChatSession.user_id == user_id)
+        .order_by(ChatSession.id.desc(), ranked.c.timestamp, ranked.c.id)
+    )
+
+    # Сессия своя: зависимость get_async_db закрывается раньше, чем закончится стрим
+    async with async_session_maker() as db:
+        yield "["
+        chat = None
+        rows = await db.stream(query.execution_options(yield_per=500))
+        async for chat_id, title, role, content in rows:
+            if chat is None or chat["id"] != chat_id:
+                if chat is not None:
+                    yield json.dumps(chat, ensure_ascii=False) + ","
+                chat = {"title": title, "id": chat_id, "email": username, "messages": []}
+            if role is not None:
+                chat["messages"].append({"role": role, "content": content})
+        if chat is not None:
+            yield json.dumps(chat, ensure_ascii=False)
+        yield "]"
+
+
+@app.get("/api/hist")
 @app.post("/api/hist")
-def get_chat_history(
+async def get_chat_history(
+    before: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    messages_limit: Optional[int] = Query(None, ge=1),
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
-    Возвращает историю (список сообщений) для указанной сессии (session_id),
-    но только если эта сессия принадлежит текущему пользователю.
+    Возвращает чаты текущего пользователя с сообщениями, от новых к старым.
+
+    Пагинация по ключу: before — id чата, с которого начинается следующая
+    страница (берётся из заголовка X-Next-Cursor, фронт проходит все
+    страницы). messages_limit ограничивает число последних сообщений в чате,
+    по умолчанию отдаются все. Если страница не изменилась
+    с прошлого запроса (If-None-Match), отвечает 304.
     """
-    chat_objs = (
-        db.query(ChatSession)
-        .filter(ChatSession.user_id == current_user.id)
-        .all()
-    )
-    if not len(chat_objs):
+    filters = [ChatSession.user_id == current_user.id]
+    if before is not None:
+        filters.append(ChatSession.id < before)
+    # Лёгкий запрос для версии страницы: id чатов, число и последний id сообщений
+    page = (await db.execute(
+        select(ChatSession.id, func.count(Message.id), func.max(Message.id))
+        .outerjoin(Message, Message.session_id == ChatSession.id)
+        .where(*filters)
+        .group_by(ChatSession.id)
+        .order_by(ChatSession.id.desc())
+        .limit(limit)
+    )).all()
+    if not page and before is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Сессия чата не найдена или не принадлежит текущему пользователю",
         )
-    
-    response = []
-    for chat in chat_objs:
-
-        messages = (
-            db.query(Message)
-            .join(ChatSession, Message.session_id == ChatSession.id)
-            .filter(
-                ChatSession.id == chat.id,
-                ChatSession.user_id == current_user.id
-            )
-            .order_by(Message.timestamp)
-            .all()
-        )
-
-        part = {
-            "title": chat.title,
-            "id": chat.id,
-            "email": current_user.username,
-            "messages": [{"role": message.role, "content": message.content} for message in messages]
-        }
-        response.append(part)
 
-    return response
+    version = f"{current_user.id}:{messages_limit}:{[tuple(row) for row in page]}"
+    etag = f'W/"{hashlib.sha1(version.encode()).hexdigest()}"'
+    headers = {"ETag": etag}
+    if len(page) == limit:
+        headers["X-Next-Cursor"] = str(page[-1][0])
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    chat_ids = [chat_id for chat_id, _, _ in page]
+    return StreamingResponse(
+        stream_chat_history(current_user.id, current_user.username, chat_ids, messages_limit),
+        media_type="application/json",
+        headers=headers,
+    )
  
  
 # -----------------------------
@@ -222,24 +461,21 @@ def get_chat_history(
 class MessageCreateRequest(BaseModel):
     role: str  # "user" или "bot"
     content: str
+    timestamp: Optional[datetime] = None  # для импорта архивных переписок
  
  
 @app.post("/api/hist/{session_id}/message")
-def add_message_to_session(
+async def add_message_to_session(
     session_id: int,
     req: MessageCreateRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Добавляет новое сообщение в указанную сессию (session_id).
     Проверяет, что сессия принадлежит текущему пользователю.
     """
-    session_obj = (
-        db.query(ChatSession)
-        .filter(ChatSession.id == session_id, ChatSession.user_id == current_user.id)
-        .first()
-    )
+    session_obj = await get_user_chat(db, session_id, current_user.id)
     if not session_obj:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -250,14 +486,71 @@ def add_message_to_session(
         session_id=session_obj.id,
         role=req.role,
         content=req.content,
-        timestamp=datetime.utcnow(),
+        timestamp=req.timestamp or datetime.utcnow(),
     )
     db.add(msg)
-    db.commit()
-    db.refresh(msg)
+    await db.commit()
     return msg
 
 
+async def insert_messages(db: AsyncSession, session_id: int, items: List[MessageCreateRequest]) -> list:
+    """
+    Вставляет сообщения за один запрос к БД: многострочный INSERT ... RETURNING,
+    а для больших импортов — COPY (тогда id не возвращаются).
+    """
+    now = datetime.utcnow()
+    rows = [
+        (session_id, item.role, item.content, item.timestamp or now)
+        for item in items
+    ]
+    if len(rows) >= settings.MESSAGES_COPY_THRESHOLD:
+        conn = await db.connection()
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            Message.__tablename__,
+            records=rows,
+            columns=["session_id", "role", "content", "timestamp"],
+        )
+        return []
+
+    result = await db.execute(
+        insert(Message)
+        .values([
+            {"session_id": sid, "role": role, "content": content, "timestamp": ts}
+            for sid, role, content, ts in rows
+        ])
+        .returning(Message.id)
+    )
+    return list(result.scalars())
+
+
+@app.post("/api/hist/{session_id}/messages")
+async def add_messages_to_session(
+    session_id: int,
+    items: List[MessageCreateRequest],
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Добавляет пачку сообщений в сессию (session_id) одной транзакцией.
+    Принадлежность сессии текущему пользователю проверяется один раз.
+    """
+    if len(items) > settings.MESSAGES_BULK_MAX:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Не больше {settings.MESSAGES_BULK_MAX} сообщений за запрос",
+        )
+    session_obj = await get_user_chat(db, session_id, current_user.id)
+    if not session_obj:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Сессия чата не найдена или не принадлежит текущему пользователю",
+        )
+    ids = await insert_messages(db, session_obj.id, items) if items else []
+    await db.commit()
+    return {"count": len(items), "ids": ids}
+
+
 '''
 from fastapi import FastAPI, Request, Depends, HTTPException, Cookie, Response
 from fastapi.responses import StreamingResponse
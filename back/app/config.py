@@ -10,6 +10,81 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     POSTGRES_PORT: str
 
+    # Пулы соединений и логирование SQL (app/db.py, ml/sql_guard.py).
+    # Бюджет на воркер uvicorn — сумма size + overflow трёх пулов:
+    # 30 (API) + 8 (синхронный) + 6 (NL2SQL) = 44 соединения; умноженный
+    # на число воркеров, он должен помещаться в max_connections Postgres
+    # (по умолчанию 100) с запасом на dataset/convert.py и psql
+    DB_POOL_SIZE: int = 10  # асинхронный движок эндпоинтов API
+    DB_MAX_OVERFLOW: int = 20
+    DB_SYNC_POOL_SIZE: int = 4  # синхронный: чекпоинтер LangGraph, индексы ML
+    DB_SYNC_MAX_OVERFLOW: int = 4
+    NL2SQL_POOL_SIZE: int = 4  # SQL NL2SQL-агента, не больше QUEST_MAX_CONCURRENCY прогонов
+    NL2SQL_MAX_OVERFLOW: int = 2
+    DB_POOL_PRE_PING: bool = True
+    DB_ECHO: bool = False
+
+    # Токены доступа, которые выдаёт /api/login (app/tokens.py)
+    SECRET_KEY: str = ""  # общий для всех воркеров; пусто — токены не выдаются, только Basic
+    ACCESS_TOKEN_TTL: int = 1800  # секунды
+
+    # Пул процессов для bcrypt (app/hashing.py)
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE: int = 64  # задач в работе и в очереди на воркер
+    PASSWORD_HASH_RETRY_AFTER: int = 1  # секунды
+
+    # Пакетная запись сообщений (/api/hist/{session_id}/messages)
+    MESSAGES_BULK_MAX: int = 50000
+    MESSAGES_COPY_THRESHOLD: int = 1000  # с этого размера пачки — COPY
+
+    # Допуск запросов к LLM-графу (app/scheduler.py)
+    QUEST_MAX_CONCURRENCY: int = 4
+    QUEST_MAX_QUEUE: int = 32
+    QUEST_RETRY_AFTER: int = 5  # секунды
+    # RAG и NL2SQL стартуют одновременно с gate и отменяются при ответе NO (ml/graph.py)
+    QUEST_SPECULATIVE: bool = False
+
+    # Кэш ответов (ml/answer_cache.py) и версия датасета (ml/dataset.py)
+    ANSWER_CACHE_SIZE: int = 1024
+    ANSWER_CACHE_TTL: int = 86400  # секунды
+    ANSWER_CACHE_PERSISTENT: bool = False  # второй уровень в таблице answer_cache
+    # Кэш результатов SQL NL2SQL-агента (ml/sql_cache.py), сжатый объём в байтах
+    SQL_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    DATASET_VERSION_CHECK_INTERVAL: int = 30  # секунды
+
+    # Исполнение SQL NL2SQL-агента (ml/sql_guard.py)
+    NL2SQL_DB_URL: str = ""  # URL под read-only ролью; пусто — основной URL в read-only транзакциях
+    NL2SQL_STATEMENT_TIMEOUT: int = 5000  # миллисекунды
+    NL2SQL_MAX_COST: float = 500000  # предел оценки EXPLAIN
+    NL2SQL_MAX_ROWS: int = 100
+
+    # Локальный поиск по корпусу документов для RAG (ml/retrieval.py)
+    RAG_INDEX_DIR: str = ""  # пусто — ml/rag_index
+    RAG_TOP_K: int = 4
+
+    # Дисковый кэш HTTP-ответов Росстата и веба (ml/http_cache.py)
+    HTTP_CACHE_PATH: str = ""  # пусто — ml/http_cache.sqlite3
+    HTTP_CACHE_TTL: int = 86400  # секунды
+
+    # Асинхронная загрузка страниц Росстата и веба (ml/fetcher.py)
+    FETCH_MAX_CONNECTIONS: int = 20
+    FETCH_PER_HOST: int = 4  # одновременных запросов к одному хосту
+    FETCH_RETRIES: int = 3
+    FETCH_TIMEOUT: float = 15  # секунды на попытку
+    FETCH_DEADLINE: float = 20  # секунды на всю загрузку
+    FETCH_BACKOFF_BASE: float = 0.5  # секунды, удваивается с каждой попыткой
+    FETCH_BACKOFF_MAX: float = 8
+
+    # Разбор PDF из веба в пуле процессов (ml/pdf.py)
+    PDF_WORKERS: int = 2
+    PDF_QUEUE: int = 16  # документов в работе и в очереди
+    PDF_MAX_PAGES: int = 50
+    PDF_MAX_CHARS: int = 200000
+
+    # История чата в состоянии графа и чекпоинтах (ml/checkpoint.py)
+    CHAT_HISTORY_LIMIT: int = 20
+    CHECKPOINTS_KEEP: int = 4
+
     model_config = SettingsConfigDict(
         env_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
         # env_file=""
@@ -21,4 +96,11 @@ class Settings(BaseSettings):
         return (f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@"
                 f"{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}")
 
+    def get_nl2sql_db_url(self):
+        return self.NL2SQL_DB_URL or self.get_db_url()
+
+    def get_async_db_url(self):
+        return (f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@"
+                f"{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}")
+
 settings = Settings()
\ No newline at end of file
@@ -1,12 +1,14 @@
-from sqlalchemy import (Column, DateTime, ForeignKey, Integer, String,
-                        create_engine, func)
+from sqlalchemy import (Column, DateTime, ForeignKey, Index, Integer,
+                        LargeBinary, String, create_engine, func)
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, relationship, sessionmaker
 from app.config import settings
 from typing import Annotated
 from datetime import datetime
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from passlib.context import CryptContext
+from fastapi.security import HTTPBasic, HTTPBasicCredentials, HTTPBearer
+from app.hashing import PasswordHasher, get_password_hash, verify_password
 
 
 DATABASE_URL = settings.get_db_url()
@@ -14,20 +16,41 @@ DATABASE_URL = settings.get_db_url()
 # -----------------------------
 # 1) Настройка SQLAlchemy
 # -----------------------------
-engine = create_engine(DATABASE_URL, echo=True)  # echo=True для вывода SQL-запросов в консоль
+# У каждого движка свой пул; вместе с nl2sql_engine (ml/sql_guard.py) это
+# бюджет соединений одного воркера uvicorn, см. комментарий в app/config.py
+pool_options = dict(
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    echo=settings.DB_ECHO,  # DB_ECHO=true для вывода SQL-запросов в консоль
+)
+# Синхронный движок: создание таблиц, чекпоинтер LangGraph и ML-часть
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=settings.DB_SYNC_POOL_SIZE,
+    max_overflow=settings.DB_SYNC_MAX_OVERFLOW,
+    **pool_options,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Асинхронный движок (asyncpg) для эндпоинтов API
+async_engine = create_async_engine(
+    settings.get_async_db_url(),
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    **pool_options,
+)
+async_session_maker = async_sessionmaker(async_engine, expire_on_commit=False)
 Base = declarative_base()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBasic()
- 
- 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
- 
- 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# Для get_current_user: Bearer-токен, а Basic — запасной вариант
+optional_basic = HTTPBasic(auto_error=False)
+bearer = HTTPBearer(auto_error=False)
+
+# bcrypt выполняется в пуле процессов (app/hashing.py)
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_QUEUE,
+    retry_after=settings.PASSWORD_HASH_RETRY_AFTER,
+)
  
  
 # -----------------------------
@@ -57,6 +80,10 @@ class ChatSession(Base):
  
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # История чата читается по session_id в порядке времени
+        Index("ix_messages_session_id_timestamp", "session_id", "timestamp"),
+    )
  
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False)
@@ -65,10 +92,72 @@ class Message(Base):
     timestamp = Column(DateTime(timezone=True), default=datetime.utcnow)
  
     session = relationship("ChatSession", back_populates="messages")
+
+
+class GraphCheckpoint(Base):
+    """Чекпоинты LangGraph, thread_id = ChatSession.id (ml/checkpoint.py)."""
+    __tablename__ = "graph_checkpoints"
+
+    session_id = Column(Integer, ForeignKey("chat_sessions.id", ondelete="CASCADE"), primary_key=True)
+    checkpoint_ns = Column(String, primary_key=True, default="")
+    checkpoint_id = Column(String, primary_key=True)
+    parent_checkpoint_id = Column(String)
+    type = Column(String, nullable=False)
+    checkpoint = Column(LargeBinary, nullable=False)
+    meta_type = Column(String, nullable=False)
+    meta = Column(LargeBinary, nullable=False)
+
+
+class GraphWrite(Base):
+    """Промежуточные записи задач графа, привязанные к чекпоинту."""
+    __tablename__ = "graph_writes"
+
+    session_id = Column(Integer, ForeignKey("chat_sessions.id", ondelete="CASCADE"), primary_key=True)
+    checkpoint_ns = Column(String, primary_key=True, default="")
+    checkpoint_id = Column(String, primary_key=True)
+    task_id = Column(String, primary_key=True)
+    idx = Column(Integer, primary_key=True)
+    channel = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    value = Column(LargeBinary, nullable=False)
+    task_path = Column(String, nullable=False, default="")
+
+
+class DatasetMeta(Base):
+    """Служебные значения датасета; version пишет dataset/convert.py."""
+    __tablename__ = "dataset_meta"
+
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)
+
+
+class AnswerCacheEntry(Base):
+    """Кэш ответов на нормализованные вопросы (ml/answer_cache.py)."""
+    __tablename__ = "answer_cache"
+
+    key = Column(String, primary_key=True)
+    dataset_version = Column(String, nullable=False)
+    answer = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
  
  
+def ensure_indexes(bind) -> None:
+    """
+    Индексы моделей для уже существующих таблиц: create_all создаёт индексы
+    только вместе с новой таблицей, поэтому добавленные позже (например,
+    ix_messages_session_id_timestamp для истории /api/hist) в старой базе
+    не появились бы.
+    """
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                # IF NOT EXISTS: воркеры uvicorn стартуют одновременно
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
 # Выполняем создание таблиц (если не созданы)
 Base.metadata.create_all(bind=engine)
+ensure_indexes(engine)
  
 def get_db():
     db = SessionLocal()
@@ -77,6 +166,11 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    async with async_session_maker() as db:
+        yield db
+
 '''
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
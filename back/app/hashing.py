@@ -0,0 +1,48 @@
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.process_pool import BoundedProcessPool, ProcessPoolFull
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Хеширование и проверка паролей (bcrypt) в отдельном пуле процессов
+    (app/process_pool.py).
+
+    Одновременно в работе и в очереди не больше max_pending задач на воркер
+    uvicorn; сверх этого запрос сразу получает 503 с Retry-After, и всплеск
+    регистраций не занимает потоки, нужные остальным эндпоинтам.
+    """
+
+    def __init__(self, workers: int, max_pending: int, retry_after: int = 1):
+        self._pool = BoundedProcessPool(workers, max_pending)
+        self._retry_after = retry_after
+
+    async def _run(self, fn, *args):
+        try:
+            return await self._pool.run(fn, *args)
+        except ProcessPoolFull:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Сервер перегружен, повторите попытку позже",
+                headers={"Retry-After": str(self._retry_after)},
+            )
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown()
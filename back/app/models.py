@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 # -----------------------------
 # 3) Схемы (Pydantic-модели)
@@ -10,6 +10,7 @@ class HistCreate(BaseModel):
 
 class Question(BaseModel):
     text: str
+    session_id: Optional[int] = None
 
 
 class RegisterRequest(BaseModel):
@@ -0,0 +1,68 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+
+class ProcessPoolFull(Exception):
+    pass
+
+
+class BoundedProcessPool:
+    """
+    Пул процессов для CPU-тяжёлых задач (bcrypt, разбор PDF) с ограничением
+    очереди: одновременно в работе и в очереди не больше max_pending задач,
+    сверх этого run() сразу бросает ProcessPoolFull. Процессы запускаются
+    при первой задаче.
+
+    Место в очереди освобождается, когда задача действительно завершилась
+    в процессе, а не когда ожидающая корутина отменена (asyncio.wait_for
+    по таймауту): иначе повторные таймауты накапливали бы работу сверх
+    max_pending.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self._workers = workers
+        self._max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: не копируем в дочерние процессы потоки и event loop сервера
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _release(self, future: Future) -> None:
+        # Колбэк вызывается из служебного потока пула
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= self._max_pending:
+                raise ProcessPoolFull("очередь пула процессов переполнена")
+            self._pending += 1
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        # Отмена ожидания отменяет задачу, только если она ещё не начата
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
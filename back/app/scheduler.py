@@ -0,0 +1,107 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, status
+
+
+class FairScheduler:
+    """
+    Допуск запросов к LLM-графу.
+
+    Одновременно выполняется не больше max_concurrency прогонов графа,
+    остальные ждут в очереди. Очередь общая, но разбита по пользователям
+    и обслуживается по кругу (round-robin по User.id), поэтому один
+    пользователь с пачкой вопросов не задерживает остальных. Если в очереди
+    уже max_queue запросов, новый получает 429 с Retry-After.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, retry_after: int = 5):
+        self._max_concurrency = max_concurrency
+        self._max_queue = max_queue
+        self._retry_after = retry_after
+        self._running = 0
+        self._queued = 0
+        self._queues: "OrderedDict[int, deque]" = OrderedDict()
+        # Метрики
+        self._admitted = 0
+        self._rejected = 0
+        self._wait_sum = 0.0
+        self._wait_max = 0.0
+
+    def check(self) -> None:
+        """
+        Бросает 429, если запрос некуда поставить. Вызывается до начала ответа.
+        """
+        if self._running >= self._max_concurrency and self._queued >= self._max_queue:
+            self._rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много запросов к модели, повторите попытку позже",
+                headers={"Retry-After": str(self._retry_after)},
+            )
+
+    def _dispatch(self) -> None:
+        # Отдаём свободные слоты пользователям по кругу
+        while self._running < self._max_concurrency and self._queues:
+            user_id, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                self._queues[user_id] = queue
+            self._queued -= 1
+            if waiter.done():
+                # Ожидание отменено, а обработчик отмены в slot() ещё не успел
+                # убрать его из очереди — слот отдаём следующему
+                continue
+            self._running += 1
+            waiter.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, user_id: int):
+        """
+        Ждёт своей очереди и держит слот на время прогона графа.
+        """
+        started = time.monotonic()
+        if self._running < self._max_concurrency and not self._queued:
+            self._running += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(user_id, deque()).append(waiter)
+            self._queued += 1
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Слот уже выдан, но запрос отменён — освобождаем
+                    self._running -= 1
+                    self._dispatch()
+                else:
+                    # Клиент ушёл, не дождавшись очереди
+                    queue = self._queues.get(user_id)
+                    if queue is not None and waiter in queue:
+                        queue.remove(waiter)
+                        self._queued -= 1
+                        if not queue:
+                            del self._queues[user_id]
+                raise
+
+        waited = time.monotonic() - started
+        self._admitted += 1
+        self._wait_sum += waited
+        self._wait_max = max(self._wait_max, waited)
+        try:
+            yield
+        finally:
+            self._running -= 1
+            self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queue_depth": self._queued,
+            "admitted_total": self._admitted,
+            "rejected_total": self._rejected,
+            "wait_seconds_sum": round(self._wait_sum, 6),
+            "wait_seconds_max": round(self._wait_max, 6),
+        }
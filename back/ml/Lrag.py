@@ -4,6 +4,7 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 from main import *
 from agents.RAG import *
+from ml.retrieval import rag_sys
 
 wikipedia_retriever = WikipediaRetriever(
         lang="ru", 
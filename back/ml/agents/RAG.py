@@ -1,15 +1,19 @@
+import asyncio
 import sys
 from pathlib import Path 
 sys.path.append(str(Path(__file__).parent.parent))  
 
 from ml.main import *
-from agents.Lrag import *
+from ml.retrieval import rag_sys
 
-def rag_agent(state: State):
+async def rag_agent(state: State):
     
     query = state['messages'][-1]['content']
     
-    context = rag_sys(query)
+    context = await asyncio.to_thread(rag_sys, query)
+    # Индекса нет или ничего не нашлось — LLM без контекста только выдумает ответ
+    if not context:
+        return {'web_search_context': ''}
     
     prompt = f"""
     Ты — ассистент по вопросам муниципалитетов России и статистики. 
@@ -21,7 +25,7 @@ def rag_agent(state: State):
 
     """
 
-    result = llm.invoke([
+    result = await llm.ainvoke([
         SystemMessage(content=prompt),
         HumanMessage(content=query)
     ])
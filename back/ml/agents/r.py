@@ -1,37 +1,62 @@
+import asyncio
+import random
+import time
 import requests
 from bs4 import BeautifulSoup
 import urllib3
-from PyPDF2 import PdfReader
-from io import BytesIO
+from urllib.parse import urljoin
+
+from app.config import settings
+from ml.fetcher import fetcher
+from ml.http_cache import HTTPCache, http_cache
+from ml.pdf import extract_pages, pdf_extractor
+from ml.retrieval import Chunk, rank_chunks, split_text
+
+ROSSTAT_SEARCH_URL = "https://rosstat.gov.ru/search"
+
+# Общая сессия: соединения к одному хосту переиспользуются между запросами
+session = requests.Session()
 
 # Отключаем предупреждения о SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-def safe_request(url, params=None, max_retries=3):
+def safe_request(url, params=None, max_retries=3, cache: HTTPCache = http_cache):
     """
     Делает GET-запрос по URL с опциональными параметрами params,
     пробует несколько раз при ошибках, возвращает объект response.
+    Ответы кэшируются на диске (ml/http_cache.py): свежий ответ из кэша
+    возвращается без обращения к сети.
     """
+    if cache is not None:
+        return cache.get(url, params, lambda headers: _download(url, params, max_retries, headers))
+    return _download(url, params, max_retries)
+
+
+def _download(url, params=None, max_retries=3, extra_headers=None):
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-        'Accept': 'text/html,application/xhtml+xml'
+        'Accept': 'text/html,application/xhtml+xml',
+        **(extra_headers or {}),
     }
     
     for attempt in range(max_retries):
         try:
             # Передаём params в запрос
-            response = requests.get(url, headers=headers, params=params, verify=False, timeout=15)
+            response = session.get(url, headers=headers, params=params, verify=False, timeout=15)
             response.raise_for_status()
             return response
         except requests.exceptions.SSLError:
             # Пробуем с альтернативными параметрами SSL
             try:
-                response = requests.get(url, headers=headers, params=params, verify='/path/to/cert.pem', timeout=15)
+                response = session.get(url, headers=headers, params=params, verify='/path/to/cert.pem', timeout=15)
                 return response
             except:
                 continue
         except Exception as e:
             print(f"Попытка {attempt + 1} не удалась: {str(e)}")
+            # Экспоненциальная пауза с джиттером, а не немедленный повтор
+            if attempt + 1 < max_retries:
+                time.sleep(0.5 * 2 ** attempt * random.uniform(0.5, 1.0))
             continue
     
     raise Exception(f"Не удалось загрузить страницу после {max_retries} попыток")
@@ -60,21 +85,76 @@ def parse_html(html):
 
 
 def parse_pdf(pdf_content):
+    # Не больше PDF_MAX_PAGES страниц и PDF_MAX_CHARS символов (ml/pdf.py)
     try:
-        pdf_file = BytesIO(pdf_content)
-        reader = PdfReader(pdf_file)
-        text = "\n".join([page.extract_text() or "" for page in reader.pages])
-        return {'type': 'pdf', 'content': text}
+        pages = extract_pages(pdf_content, settings.PDF_MAX_PAGES, settings.PDF_MAX_CHARS)
+        return {'type': 'pdf', 'content': "\n".join(text for _, text in pages)}
     except Exception as e:
         return {'error': str(e)}
 
 
-def rosstat_search(query):
+def document_chunks(url, title, pages):
+    """
+    Фрагменты документа для ранжирования (ml/retrieval.py); у PDF в источнике
+    указывается страница.
+    """
+    chunks = []
+    for page, text in pages:
+        source = f"{url}#page={page}" if page else url
+        chunks += [Chunk(source, title, piece) for piece in split_text(text)]
+    return chunks
+
+
+def is_pdf(url, response):
+    return 'pdf' in response.headers.get('Content-Type', '') or url.lower().endswith('.pdf')
+
+
+def fetch_document(url, cache: HTTPCache = http_cache):
+    """
+    Загружает страницу или PDF по ссылке из rosstat_search и разбирает её.
+    """
+    response = safe_request(url, cache=cache)
+    if is_pdf(url, response):
+        return parse_pdf(response.content)
+    return parse_html(response.text)
+
+
+def parse_search(html, base_url=ROSSTAT_SEARCH_URL):
+    """
+    Результаты поиска Росстата: список словарей {title, url, date}.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    results = []
+    # Здесь предполагаем, что результаты лежат в контейнере с классом .search-results
+    # и каждая запись — в элементе с классом .search-item
+    for item in soup.select('.search-results .search-item'):
+        title_tag = item.select_one('.search-title a')
+        if title_tag:
+            url = title_tag['href']
+            title = title_tag.text.strip()
+            date_tag = item.select_one('.search-date')
+            date = date_tag.text.strip() if date_tag else ''
+
+            # Если внутренняя ссылка без домена, дополняем
+            if url.startswith('/'):
+                url = urljoin(base_url, url)
+
+            results.append({
+                'title': title,
+                'url': url,
+                'date': date
+            })
+
+    return results
+
+
+def rosstat_search(query, cache: HTTPCache = http_cache):
     """
     Делает поиск на сайте rosstat.gov.ru через их встроенный search-интерфейс,
     возвращает список словарей {title, url, date}.
     """
-    base_url = "https://rosstat.gov.ru/search"
+    base_url = ROSSTAT_SEARCH_URL
     params = {
         'q': query,
         'sort': 'date',
@@ -83,33 +163,69 @@ def rosstat_search(query):
     
     try:
         # Передаём params в safe_request
-        response = safe_request(base_url, params=params)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        results = []
-        # Здесь предполагаем, что результаты лежат в контейнере с классом .search-results
-        # и каждая запись — в элементе с классом .search-item
-        for item in soup.select('.search-results .search-item'):
-            title_tag = item.select_one('.search-title a')
-            if title_tag:
-                url = title_tag['href']
-                title = title_tag.text.strip()
-                date_tag = item.select_one('.search-date')
-                date = date_tag.text.strip() if date_tag else ''
-                
-                # Если внутренняя ссылка без домена, дополняем
-                if url.startswith('/'):
-                    url = 'https://wikipedia.org' + url
-                
-                results.append({
-                    'title': title,
-                    'url': url,
-                    'date': date
-                })
-        
-        return results
+        response = safe_request(base_url, params=params, cache=cache)
+        return parse_search(response.text, base_url)
+    except Exception as e:
+        return {'error': str(e)}
+
+
+async def afetch_document(url, deadline=None):
+    """
+    Асинхронный fetch_document через общий пул соединений (ml/fetcher.py).
+    """
+    response = await fetcher.fetch(url, deadline=deadline)
+    if is_pdf(url, response):
+        # Разбор PDF — в пуле процессов, не дольше оставшегося дедлайна
+        timeout = deadline - asyncio.get_running_loop().time() if deadline is not None else None
+        pages = await asyncio.wait_for(pdf_extractor.extract(response.content), timeout)
+        title = url.rstrip('/').rsplit('/', 1)[-1]
+        return {'type': 'pdf', 'title': title, 'chunks': document_chunks(url, title, pages)}
+    document = await asyncio.to_thread(parse_html, response.text)
+    document['chunks'] = document_chunks(url, document['title'], [(None, document['text'])])
+    return document
+
+
+async def arosstat_search(query, top_k=3, search_url=ROSSTAT_SEARCH_URL):
+    """
+    Поиск на rosstat.gov.ru и параллельная загрузка первых top_k документов
+    в пределах одного дедлайна (settings.FETCH_DEADLINE): вместо цепочки
+    15-секундных таймаутов — одна ограниченная по времени пачка запросов.
+    Каждый результат дополняется полем document (или error).
+    """
+    deadline = asyncio.get_running_loop().time() + settings.FETCH_DEADLINE
+    params = {
+        'q': query,
+        'sort': 'date',
+        'items_per_page': 10
+    }
+    try:
+        response = await fetcher.fetch(search_url, params=params, deadline=deadline)
     except Exception as e:
         return {'error': str(e)}
 
+    results = parse_search(response.text, search_url)[:top_k]
+    documents = await asyncio.gather(
+        *(afetch_document(result['url'], deadline=deadline) for result in results),
+        return_exceptions=True,
+    )
+    for result, document in zip(results, documents):
+        if isinstance(document, Exception):
+            result['error'] = str(document) or type(document).__name__
+        else:
+            result['document'] = document
+    return results
+
+
+async def arosstat_passages(query, top_k=3, k=4, search_url=ROSSTAT_SEARCH_URL):
+    """
+    Фрагменты найденных документов, ранжированные по вопросу
+    (BM25 + векторы, как в локальном индексе), без склейки в одну строку.
+    """
+    results = await arosstat_search(query, top_k=top_k, search_url=search_url)
+    if isinstance(results, dict):
+        return []
+    chunks = [chunk for result in results for chunk in result.get('document', {}).get('chunks', [])]
+    return await asyncio.to_thread(rank_chunks, query, chunks, k)
 
-rosstat_search('население ростова')
\ No newline at end of file
+if __name__ == "__main__":
+    print(rosstat_search('население ростова'))
\ No newline at end of file
@@ -4,7 +4,7 @@ sys.path.append(str(Path(__file__).parent.parent))  # Добавляет /worksp
 
 from ml.main import *
 
-def responder(state: State):
+async def responder(state: State):
     query = state["messages"][-1]["content"]
     style = state.get("message_type", "formal")
     web_ctx = state.get("web_search_context", "")
@@ -31,10 +31,13 @@ def responder(state: State):
 
         Оформи ответ в стиле: {style}.
     """
-    result = llm.invoke([
+    # Стримим ответ: токены подхватывает graph.astream(stream_mode="messages")
+    content = ""
+    async for chunk in llm.astream([
         SystemMessage(content=prompt),
         HumanMessage(content=query)
-    ])
+    ]):
+        content += chunk.content
 
     # Добавляем готовый ответ в историю сообщений
-    return {"messages": [{"role": "assistant", "content": result.content}]}
\ No newline at end of file
+    return {"messages": [{"role": "assistant", "content": content}]}
\ No newline at end of file
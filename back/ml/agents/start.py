@@ -5,58 +5,59 @@ sys.path.append(str(Path(__file__).parent.parent))  # Добавляет /worksp
 
 from main import *
 from agents.nl2sql import qwen
+from ml.gate import domain_vocabulary, guess_style
 
-def clarify(state: State):
+async def gate(state: State):
+    """
+    Один шаг вместо clarify + classify: относится ли запрос к домену
+    (YES/NO) и в каком стиле отвечать (formal/informal).
+    """
     query = state['messages'][-1]['content']
 
+    # Быстрый путь: в вопросе есть и метрика, и муниципалитет — LLM не нужна
+    if await domain_vocabulary.amatch(query):
+        return {'access': 'YES', 'message_type': guess_style(query)}
+
     prompt=f"""
-        Твоя задача - одобрить запрос пользователя.
-        Если запрос пользователя связан с муниципалитетами, субъектами России, территориями, статистиками
-        и прочей аналитически-деловой областью, то верни "YES".
+        Твоя задача - одобрить запрос пользователя и определить стиль ответа.
+
+        access: если запрос пользователя связан с муниципалитетами, субъектами России, территориями, статистиками
+        и прочей аналитически-деловой областью, то верни "YES". В ином случае верни "NO".
 
-        В ином случае верни "NO".
+        message_type: если запрос носит официальный деловой характер (запрос статистики, аналитика,
+        формальные формулировки), верни "formal". Если запрос скорее непринужденный, разговорный,
+        шуточный или личный — верни "informal".
 
-        {parser_clarify.get_format_instructions()}
+        {parser_gate.get_format_instructions()}
 
     """
 
-    result = qwen.invoke([
+    result = await qwen.ainvoke([
         SystemMessage(content=prompt),
         HumanMessage(content=query)
     ])
 
-    parsed = parser_clarify.parse(result.content)
-    print(parsed)
-    prompt = """
-            Ты помощник по вопросам статистики, городов, областей и других субъектов РФ. 
-            Пользователь интересуется у тебя вопросом,
-            не связанным с твоей доменной областью. Вежливо объясни ему, 
-            что ты консультируешь по вопросам муниципальных образований.
-                    
-        """
-    if parsed.message_type == 'NO':
-        result = llm.invoke([
-            SystemMessage(content=prompt),
-            HumanMessage(content=query)
-        ])
-        print(result.content)
-    
-
-    return  {'access':parsed.message_type}
-
-
-def classify(state: State):
-    query = state["messages"][-1]["content"]
-    prompt = f"""
-        Твоя задача — определить стиль ответа: официальный (formal) или неофициальный (informal).
-        Если запрос пользователя носит официальный деловой характер (запрос статистики, аналитика, формальные формулировки), 
-        верни "formal". Если запрос скорее непринужденный, разговорный, шуточный или личный — верни "informal".
-
-        {parser_classify.get_format_instructions()}
-    """
-    result = llm.invoke([
-        SystemMessage(content=prompt),
-        HumanMessage(content=query)
-    ])
-    parsed = parser_classify.parse(result.content)
-    return {"message_type": parsed.message_type}
\ No newline at end of file
+    parsed = parser_gate.parse(result.content)
+    return {'access': parsed.access, 'message_type': parsed.message_type}
+
+
+# Отказы на вопросы вне домена: шаблон по стилю, без обращения к LLM
+REFUSALS = {
+    'formal': (
+        "К сожалению, я не могу помочь с этим вопросом. Я консультирую по вопросам "
+        "муниципальных образований и субъектов РФ: численность населения, миграция, "
+        "заработные платы, потребление и доступность рынков. Пожалуйста, "
+        "сформулируйте вопрос в рамках этой тематики."
+    ),
+    'informal': (
+        "Тут я, увы, не помощник :) Я разбираюсь в муниципалитетах и регионах России — "
+        "население, миграция, зарплаты, потребление, доступность рынков. "
+        "Спроси что-нибудь из этого!"
+    ),
+}
+
+
+async def refusal(state: State):
+    style = state.get("message_type") or "formal"
+    content = REFUSALS.get(style, REFUSALS['formal'])
+    return {"messages": [{"role": "assistant", "content": content}]}
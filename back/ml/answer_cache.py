@@ -0,0 +1,136 @@
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine
+
+from app.db import AnswerCacheEntry
+from ml.dataset import DatasetVersion
+
+
+def normalize_question(text: str) -> str:
+    """
+    Ключ кэша: регистр, ё/е, пунктуация и лишние пробелы не различаются.
+    """
+    text = text.lower().replace("ё", "е")
+    text = re.sub(r"[^\w\s-]", " ", text)
+    return " ".join(text.split())
+
+
+class AnswerCache:
+    """
+    Кэш готовых ответов графа на повторяющиеся вопросы.
+
+    Первый уровень — LRU в памяти процесса, второй (persistent=True) —
+    таблица answer_cache в Postgres, общая для всех воркеров. Записи живут
+    ttl секунд и привязаны к версии датасета: после перезагрузки данных
+    (dataset/convert.py) старые ответы больше не выдаются.
+
+    LRU защищён блокировкой: сброс по смене версии вызывается из потока,
+    в котором DatasetVersion перечитывает dataset_meta, а не из event loop.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        version: DatasetVersion,
+        max_size: int = 1024,
+        ttl: float = 86400,
+        persistent: bool = False,
+    ):
+        self._engine = engine
+        self._version = version
+        self._max_size = max_size
+        self._ttl = ttl
+        self._persistent = persistent
+        self._items: "OrderedDict[str, tuple[float, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        version.on_change(lambda _: self.clear())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def _remember(self, key: str, version: str, answer: str) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic() + self._ttl, version, answer)
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_size:
+                self._items.popitem(last=False)
+
+    def _recall(self, key: str, version: str) -> Optional[str]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, item_version, answer = item
+            if expires > time.monotonic() and item_version == version:
+                self._items.move_to_end(key)
+                return answer
+            del self._items[key]
+            return None
+
+    def _load(self, key: str, version: str) -> Optional[str]:
+        with self._engine.connect() as conn:
+            return conn.execute(
+                select(AnswerCacheEntry.answer).where(
+                    AnswerCacheEntry.key == key,
+                    AnswerCacheEntry.dataset_version == version,
+                    AnswerCacheEntry.created_at > func.now() - timedelta(seconds=self._ttl),
+                )
+            ).scalar()
+
+    def _save(self, key: str, version: str, answer: str) -> None:
+        stmt = pg_insert(AnswerCacheEntry.__table__).values(
+            key=key, dataset_version=version, answer=answer, created_at=func.now()
+        )
+        with self._engine.begin() as conn:
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=["key"],
+                set_={
+                    "dataset_version": stmt.excluded.dataset_version,
+                    "answer": stmt.excluded.answer,
+                    "created_at": stmt.excluded.created_at,
+                },
+            ))
+
+    async def aget(self, question: str) -> Optional[str]:
+        key = normalize_question(question)
+        version = await self._version.aget()
+
+        answer = self._recall(key, version)
+        if answer is not None:
+            self.hits += 1
+            return answer
+
+        if self._persistent:
+            answer = await asyncio.to_thread(self._load, key, version)
+            if answer is not None:
+                self._remember(key, version, answer)
+                self.hits += 1
+                return answer
+
+        self.misses += 1
+        return None
+
+    async def aput(self, question: str, answer: str) -> None:
+        key = normalize_question(question)
+        version = await self._version.aget()
+        self._remember(key, version, answer)
+        if self._persistent:
+            await asyncio.to_thread(self._save, key, version, answer)
+
+    def stats(self) -> dict:
+        return {
+            "hits_total": self.hits,
+            "misses_total": self.misses,
+            "size": len(self._items),
+        }
@@ -0,0 +1,14 @@
+from typing import Optional
+
+
+def new_state(messages: Optional[list] = None) -> dict:
+    """
+    Пустое состояние графа для одного хода (опционально с историей сообщений).
+    """
+    return {
+        "messages": list(messages or []),
+        "message_type": None,
+        "access": "NO",
+        "web_search_context": None,
+        "nl2sql_context": None,
+    }
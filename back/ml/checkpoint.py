@@ -0,0 +1,287 @@
+import asyncio
+import zlib
+from typing import Any, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine
+
+from app.db import GraphCheckpoint, GraphWrite
+
+# Сериализованные значения больше этого порога сжимаем zlib
+COMPRESS_MIN_SIZE = 512
+ZLIB_SUFFIX = "+zlib"
+
+
+class PostgresCheckpointSaver(BaseCheckpointSaver):
+    """
+    Чекпоинтер LangGraph поверх общего Postgres (app.db.engine).
+
+    thread_id — это ChatSession.id, поэтому любой воркер uvicorn может продолжить
+    любой чат. Чекпоинты сериализуются serde графа и сжимаются zlib, для каждого
+    чата хранятся только keep последних чекпоинтов.
+    """
+
+    def __init__(self, engine: Engine, keep: int = 4, serde=None):
+        super().__init__(serde=serde)
+        self.engine = engine
+        self.keep = keep
+
+    # -----------------------------
+    # Сериализация
+    # -----------------------------
+    def _dumps(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) >= COMPRESS_MIN_SIZE:
+            return type_ + ZLIB_SUFFIX, zlib.compress(data)
+        return type_, data
+
+    def _loads(self, type_: str, data: bytes) -> Any:
+        if type_.endswith(ZLIB_SUFFIX):
+            type_, data = type_[: -len(ZLIB_SUFFIX)], zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+    @staticmethod
+    def _thread(config: RunnableConfig) -> tuple[int, str]:
+        configurable = config["configurable"]
+        return int(configurable["thread_id"]), configurable.get("checkpoint_ns", "")
+
+    def _to_tuple(self, conn, row: GraphCheckpoint) -> CheckpointTuple:
+        writes = conn.execute(
+            select(GraphWrite.task_id, GraphWrite.channel, GraphWrite.type, GraphWrite.value)
+            .where(
+                GraphWrite.session_id == row.session_id,
+                GraphWrite.checkpoint_ns == row.checkpoint_ns,
+                GraphWrite.checkpoint_id == row.checkpoint_id,
+            )
+            .order_by(GraphWrite.task_id, GraphWrite.idx)
+        ).all()
+        configurable = {
+            "thread_id": str(row.session_id),
+            "checkpoint_ns": row.checkpoint_ns,
+        }
+        return CheckpointTuple(
+            config={"configurable": {**configurable, "checkpoint_id": row.checkpoint_id}},
+            checkpoint=self._loads(row.type, row.checkpoint),
+            metadata=self._loads(row.meta_type, row.meta),
+            parent_config=(
+                {"configurable": {**configurable, "checkpoint_id": row.parent_checkpoint_id}}
+                if row.parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self._loads(type_, value))
+                for task_id, channel, type_, value in writes
+            ],
+        )
+
+    # -----------------------------
+    # Синхронный API
+    # -----------------------------
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        session_id, checkpoint_ns = self._thread(config)
+        query = select(GraphCheckpoint.__table__).where(
+            GraphCheckpoint.session_id == session_id,
+            GraphCheckpoint.checkpoint_ns == checkpoint_ns,
+        )
+        if checkpoint_id := get_checkpoint_id(config):
+            query = query.where(GraphCheckpoint.checkpoint_id == checkpoint_id)
+        else:
+            query = query.order_by(GraphCheckpoint.checkpoint_id.desc()).limit(1)
+
+        with self.engine.connect() as conn:
+            row = conn.execute(query).first()
+            if row is None:
+                return None
+            return self._to_tuple(conn, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = select(GraphCheckpoint.__table__).order_by(GraphCheckpoint.checkpoint_id.desc())
+        if config is not None:
+            session_id, checkpoint_ns = self._thread(config)
+            query = query.where(
+                GraphCheckpoint.session_id == session_id,
+                GraphCheckpoint.checkpoint_ns == checkpoint_ns,
+            )
+            if checkpoint_id := get_checkpoint_id(config):
+                query = query.where(GraphCheckpoint.checkpoint_id == checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            query = query.where(GraphCheckpoint.checkpoint_id < before_id)
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).all()
+            found = 0
+            for row in rows:
+                if limit is not None and found >= limit:
+                    break
+                item = self._to_tuple(conn, row)
+                if filter and any(item.metadata.get(k) != v for k, v in filter.items()):
+                    continue
+                found += 1
+                yield item
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        session_id, checkpoint_ns = self._thread(config)
+        type_, data = self._dumps(checkpoint)
+        meta_type, meta = self._dumps(dict(metadata))
+        values = {
+            "session_id": session_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+            "parent_checkpoint_id": get_checkpoint_id(config),
+            "type": type_,
+            "checkpoint": data,
+            "meta_type": meta_type,
+            "meta": meta,
+        }
+        table = GraphCheckpoint.__table__
+        with self.engine.begin() as conn:
+            stmt = pg_insert(table).values(**values)
+            conn.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=["session_id", "checkpoint_ns", "checkpoint_id"],
+                    set_={k: stmt.excluded[k] for k in ("parent_checkpoint_id", "type", "checkpoint", "meta_type", "meta")},
+                )
+            )
+            self._prune(conn, session_id, checkpoint_ns)
+
+        return {
+            "configurable": {
+                "thread_id": str(session_id),
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def _prune(self, conn, session_id: int, checkpoint_ns: str) -> None:
+        """
+        Удаляет всё, кроме keep последних чекпоинтов чата, вместе с их writes.
+        """
+        oldest_kept = conn.execute(
+            select(GraphCheckpoint.checkpoint_id)
+            .where(
+                GraphCheckpoint.session_id == session_id,
+                GraphCheckpoint.checkpoint_ns == checkpoint_ns,
+            )
+            .order_by(GraphCheckpoint.checkpoint_id.desc())
+            .offset(self.keep - 1)
+            .limit(1)
+        ).scalar()
+        if oldest_kept is None:
+            return
+        for model in (GraphWrite, GraphCheckpoint):
+            conn.execute(
+                delete(model).where(
+                    model.session_id == session_id,
+                    model.checkpoint_ns == checkpoint_ns,
+                    model.checkpoint_id < oldest_kept,
+                )
+            )
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        session_id, checkpoint_ns = self._thread(config)
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dumps(value)
+            rows.append({
+                "session_id": session_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id,
+                "task_id": task_id,
+                "idx": WRITES_IDX_MAP.get(channel, idx),
+                "channel": channel,
+                "type": type_,
+                "value": data,
+                "task_path": task_path,
+            })
+        if not rows:
+            return
+
+        stmt = pg_insert(GraphWrite.__table__).values(rows)
+        keys = ["session_id", "checkpoint_ns", "checkpoint_id", "task_id", "idx"]
+        if all(channel in WRITES_IDX_MAP for channel, _ in writes):
+            # Специальные записи (ошибки, прерывания) перезаписываем
+            stmt = stmt.on_conflict_do_update(
+                index_elements=keys,
+                set_={k: stmt.excluded[k] for k in ("channel", "type", "value", "task_path")},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=keys)
+        with self.engine.begin() as conn:
+            conn.execute(stmt)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.engine.begin() as conn:
+            for model in (GraphWrite, GraphCheckpoint):
+                conn.execute(delete(model).where(model.session_id == int(thread_id)))
+
+    # -----------------------------
+    # Асинхронный API: синхронные методы в пуле потоков
+    # -----------------------------
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
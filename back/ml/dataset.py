@@ -0,0 +1,61 @@
+import asyncio
+import time
+from typing import Callable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.config import settings
+from app.db import DatasetMeta, engine
+
+
+class DatasetVersion:
+    """
+    Версия датасета, которую dataset/convert.py пишет в dataset_meta
+    при каждой загрузке. Значение перечитывается не чаще, чем раз
+    в check_interval секунд; при смене версии вызываются подписчики
+    (сброс кэшей ответов и SQL-результатов, обновление схемы и т.п.).
+    """
+
+    def __init__(self, engine: Engine, check_interval: float = 30):
+        self._engine = engine
+        self._check_interval = check_interval
+        self._value: Optional[str] = None
+        self._checked = 0.0
+        self._listeners: List[Callable[[str], None]] = []
+
+    def on_change(self, callback: Callable[[str], None]) -> None:
+        self._listeners.append(callback)
+
+    @property
+    def stale(self) -> bool:
+        return self._value is None or time.monotonic() - self._checked >= self._check_interval
+
+    def refresh(self) -> str:
+        try:
+            with self._engine.connect() as conn:
+                value = conn.execute(
+                    select(DatasetMeta.value).where(DatasetMeta.key == "version")
+                ).scalar()
+        except SQLAlchemyError:
+            value = self._value
+        value = value or "0"
+        self._checked = time.monotonic()
+
+        previous, self._value = self._value, value
+        if previous is not None and previous != value:
+            for callback in self._listeners:
+                callback(value)
+        return value
+
+    def get(self) -> str:
+        return self.refresh() if self.stale else self._value
+
+    async def aget(self) -> str:
+        if self.stale:
+            return await asyncio.to_thread(self.refresh)
+        return self._value
+
+
+dataset_version = DatasetVersion(engine, settings.DATASET_VERSION_CHECK_INTERVAL)
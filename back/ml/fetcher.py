@@ -0,0 +1,184 @@
+import asyncio
+import random
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from app.config import settings
+from ml.http_cache import HTTPCache, http_cache
+
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/pdf",
+}
+
+# Ответы, после которых есть смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def to_response(response: httpx.Response) -> requests.Response:
+    """
+    Ответ httpx в виде requests.Response: так его принимают HTTPCache
+    и парсеры ml/agents/r.py.
+    """
+    result = requests.Response()
+    result.url, result.status_code = str(response.url), response.status_code
+    result.headers = CaseInsensitiveDict(response.headers)
+    result._content = response.content
+    result.encoding = response.encoding
+    return result
+
+
+class AsyncFetcher:
+    """
+    Асинхронная загрузка страниц Росстата и веба: общий httpx.AsyncClient
+    с пулом соединений, ограничение одновременных запросов к одному хосту,
+    повторы с экспоненциальной задержкой и джиттером и общий дедлайн на
+    всю загрузку. Ответы проходят через дисковый кэш (ml/http_cache.py).
+    """
+
+    def __init__(self, max_connections: int, per_host: int, retries: int, timeout: float,
+                 backoff_base: float, backoff_max: float, cache: Optional[HTTPCache] = None):
+        self._max_connections = max_connections
+        self._per_host = per_host
+        self._retries = retries
+        self._timeout = timeout
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._cache = cache
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        # Метрики
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.deadlines = 0
+
+    def _ensure(self) -> httpx.AsyncClient:
+        # Клиент и семафоры привязаны к циклу событий, в котором созданы
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers=HEADERS,
+                limits=httpx.Limits(
+                    max_connections=self._max_connections,
+                    max_keepalive_connections=self._max_connections,
+                ),
+                timeout=self._timeout,
+                follow_redirects=True,
+                verify=False,
+            )
+            self._loop, self._hosts = loop, {}
+        return self._client
+
+    def _host(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self._per_host)
+        return self._hosts[host]
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        delay = min(self._backoff_max, self._backoff_base * 2 ** attempt)
+        retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+        if retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self._backoff_max))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _download(self, url: str, params: Optional[dict], headers: dict, deadline: float) -> requests.Response:
+        client = self._ensure()
+        loop = asyncio.get_running_loop()
+        error: Optional[Exception] = None
+        for attempt in range(self._retries):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            response = None
+            try:
+                async with self._host(url):
+                    self.requests += 1
+                    response = await client.get(
+                        url, params=params, headers=headers, timeout=min(self._timeout, remaining)
+                    )
+                if response.status_code not in RETRY_STATUSES:
+                    # 304 — не ошибка: это ответ на условный запрос, его разбирает HTTPCache
+                    if response.is_error:
+                        self.failures += 1
+                        response.raise_for_status()
+                    return to_response(response)
+                error = httpx.HTTPStatusError(
+                    f"HTTP {response.status_code}", request=response.request, response=response
+                )
+            except httpx.TransportError as exc:
+                error = exc
+
+            delay = self._backoff(attempt, response)
+            if attempt + 1 == self._retries or loop.time() + delay >= deadline:
+                break
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+        if error is None or loop.time() >= deadline:
+            self.deadlines += 1
+            raise DeadlineExceeded(f"{url}: дедлайн загрузки истёк")
+        self.failures += 1
+        raise error
+
+    async def fetch(self, url: str, params: Optional[dict] = None,
+                    deadline: Optional[float] = None) -> requests.Response:
+        """
+        GET по URL; deadline — момент loop.time(), после которого
+        новые попытки не делаются.
+        """
+        if deadline is None:
+            deadline = asyncio.get_running_loop().time() + settings.FETCH_DEADLINE
+
+        async def download(headers: dict) -> requests.Response:
+            return await self._download(url, params, headers, deadline)
+
+        if self._cache is None:
+            return await download({})
+        return await self._cache.aget(url, params, download)
+
+    async def fetch_many(self, urls: List[str], deadline: Optional[float] = None) -> List[Optional[requests.Response]]:
+        """
+        Параллельная загрузка; на месте неудавшихся ответов — None.
+        """
+        if deadline is None:
+            deadline = asyncio.get_running_loop().time() + settings.FETCH_DEADLINE
+        results = await asyncio.gather(
+            *(self.fetch(url, deadline=deadline) for url in urls), return_exceptions=True
+        )
+        return [None if isinstance(result, Exception) else result for result in results]
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "requests_total": self.requests,
+            "retries_total": self.retries,
+            "failures_total": self.failures,
+            "deadline_exceeded_total": self.deadlines,
+        }
+
+
+fetcher = AsyncFetcher(
+    max_connections=settings.FETCH_MAX_CONNECTIONS,
+    per_host=settings.FETCH_PER_HOST,
+    retries=settings.FETCH_RETRIES,
+    timeout=settings.FETCH_TIMEOUT,
+    backoff_base=settings.FETCH_BACKOFF_BASE,
+    backoff_max=settings.FETCH_BACKOFF_MAX,
+    cache=http_cache,
+)
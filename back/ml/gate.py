@@ -0,0 +1,86 @@
+import re
+
+from ml.municipalities import MunicipalityIndex, municipality_index, tokenize
+
+
+# Метрики датасета (префиксы основ). Общие слова — «рейтинг», «район»,
+# «доход», «трата» — сюда не входят: они есть и в вопросах про фильмы,
+# книги или прогулки
+METRIC_KEYWORDS = (
+    "населени", "численност", "жител", "зарплат", "заработн",
+    "миграц", "мигрант", "потреблени", "доступност",
+    "рынк", "рынок", "статистик", "муниципал",
+    "поселени", "оквэд", "отрасл", "росстат",
+)
+
+# Служебные слова из названий МО, которые встречаются и вне домена
+NAME_STOP_PREFIXES = (
+    "город", "сельск", "район", "округ", "посел", "муниципал", "образовани",
+    "автоном", "област", "республик", "деревн", "станиц", "рабоч",
+)
+NAME_STOPWORDS = {
+    "новый", "новая", "красный", "красная", "большой", "большая", "малый",
+    "верхний", "нижний", "старый", "мирный", "лесной", "зеленый", "южный",
+    "северный", "советский", "советская", "центральный", "октябрьский",
+    "первомайский", "заречный", "солнечный", "светлый", "полярный",
+}
+
+# Признаки разговорного стиля
+INFORMAL_MARKERS = {
+    "привет", "прив", "здарова", "хай", "плиз", "пж", "пжл", "спс", "ну",
+    "че", "чо", "чего", "короче", "блин", "слушай", "скажи", "подскажи",
+    "глянь", "давай", "ок", "лол",
+}
+
+MIN_NAME_LENGTH = 5
+
+
+def guess_style(text: str) -> str:
+    """
+    Стиль ответа без LLM: разговорные слова, смайлы и «!!» — informal.
+    """
+    if set(tokenize(text)) & INFORMAL_MARKERS:
+        return "informal"
+    if re.search(r"[)]{2,}|!{2,}|:\)|\)\s*$", text):
+        return "informal"
+    return "formal"
+
+
+class DomainVocabulary:
+    """
+    Быстрый путь gate: если в вопросе есть и ключевое слово метрики,
+    и название муниципалитета или региона (ml/municipalities.py), вопрос
+    пропускается без обращения к LLM; всё остальное решает LLM-gate.
+    Нечёткие совпадения и названия из общеупотребительных слов
+    («Советский», «Мирный») не учитываются.
+    """
+
+    def __init__(self, index: MunicipalityIndex):
+        self._index = index
+
+    @staticmethod
+    def _keywords(query: str) -> bool:
+        return any(word.startswith(METRIC_KEYWORDS) for word in tokenize(query))
+
+    @staticmethod
+    def _distinctive(name: str) -> bool:
+        word = name.lower().replace("ё", "е")
+        return (len(word) >= MIN_NAME_LENGTH and word not in NAME_STOPWORDS
+                and not word.startswith(NAME_STOP_PREFIXES))
+
+    def _matches(self, mentions, regions) -> bool:
+        return bool(regions) or any(self._distinctive(m.municipality.name) for m in mentions)
+
+    def match(self, query: str) -> bool:
+        if not self._keywords(query):
+            return False
+        return self._matches(self._index.find(query, fuzzy=False), self._index.find_regions(query))
+
+    async def amatch(self, query: str) -> bool:
+        if not self._keywords(query):
+            return False
+        mentions = await self._index.afind(query, fuzzy=False)
+        return self._matches(mentions, self._index.find_regions(query))
+
+
+domain_vocabulary = DomainVocabulary(municipality_index)
@@ -1,39 +1,112 @@
 
+import asyncio
+import time
+
 from ml.main import *
 from ml.agents.start import *
 from ml.agents.RAG import * 
 from ml.agents.nl2sql import * 
 from ml.agents.responder import * 
+from ml.chat_state import new_state
+
+class SpeculationStats:
+    """
+    Учёт спекулятивного режима: сколько прогонов RAG/NL2SQL запущено
+    до решения gate и сколько из них отменено впустую (ответ NO).
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+        self.wasted_seconds = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "started_total": self.started,
+            "cancelled_total": self.cancelled,
+            "wasted_seconds_sum": round(self.wasted_seconds, 6),
+        }
+
+
+speculation = SpeculationStats()
+
+
+async def speculative_gate(state: State):
+    """
+    gate, rag_agent и nl2sql_agent одновременно. Почти все вопросы проходят
+    gate, поэтому сбор контекста не ждёт его решения; при NO задачи
+    отменяются вместе с их HTTP-запросами к моделям.
+    """
+    started = time.monotonic()
+    tasks = [
+        asyncio.create_task(rag_agent(state)),
+        asyncio.create_task(nl2sql_agent(state)),
+    ]
+    speculation.started += 1
+    try:
+        verdict = await gate(state)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    if verdict.get("access") != "YES":
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        speculation.cancelled += 1
+        speculation.wasted_seconds += (time.monotonic() - started) * len(tasks)
+        return verdict
+
+    update = dict(verdict)
+    for result in await asyncio.gather(*tasks):
+        update.update(result)
+    return update
+
 
-state: State = {
-    "messages": [],
-    "message_type": None,
-    "access": "NO",
-    "web_search_context": None,
-    "nl2sql_context": None
-}
+def route_speculative(state: State):
+    return "responder" if state.get("access") == "YES" else "refusal"
+
+
+def route_gate(state: State):
+    # YES — параллельно запускаем обе ветки сбора контекста
+    if state.get("access") == "YES":
+        return ["rag_agent", "nl2sql_agent"]
+    # NO — один шаблонный отказ и конец графа
+    return "refusal"
+
+def startup(checkpointer=None, speculative=None):
+    if speculative is None:
+        speculative = settings.QUEST_SPECULATIVE
 
-def startup():
     graph_builder = StateGraph(State)
 
-    graph_builder.add_node("clarify", clarify)
-    graph_builder.add_node("classifier", classify)
-    graph_builder.add_node("rag_agent", rag_agent)
-    graph_builder.add_node("nl2sql_agent", nl2sql_agent)
     graph_builder.add_node("responder", responder)
-    graph_builder.add_edge(START, "clarify")
-    graph_builder.add_conditional_edges(
-        "clarify",
-        lambda state: state.get("access"),
-        {"YES": "classifier", "NO": "clarify"}
-    )
-    graph_builder.add_edge("classifier", "rag_agent")
-    graph_builder.add_edge("classifier", "nl2sql_agent")
-    graph_builder.add_edge("rag_agent", "responder")
-    graph_builder.add_edge("nl2sql_agent", "responder")
+    graph_builder.add_node("refusal", refusal)
+    if speculative:
+        graph_builder.add_node("gate", speculative_gate)
+        graph_builder.add_edge(START, "gate")
+        graph_builder.add_conditional_edges(
+            "gate",
+            route_speculative,
+            ["responder", "refusal"]
+        )
+    else:
+        graph_builder.add_node("gate", gate)
+        graph_builder.add_node("rag_agent", rag_agent)
+        graph_builder.add_node("nl2sql_agent", nl2sql_agent)
+        graph_builder.add_edge(START, "gate")
+        graph_builder.add_conditional_edges(
+            "gate",
+            route_gate,
+            ["rag_agent", "nl2sql_agent", "refusal"]
+        )
+        graph_builder.add_edge("rag_agent", "responder")
+        graph_builder.add_edge("nl2sql_agent", "responder")
     graph_builder.add_edge("responder", END)
+    graph_builder.add_edge("refusal", END)
 
-    graph = graph_builder.compile()
+    graph = graph_builder.compile(checkpointer=checkpointer)
     return graph
 
 def quest_model(user_input: str, state, graph):
@@ -42,14 +115,55 @@ def quest_model(user_input: str, state, graph):
         
     state["messages"].append({"role": "user", "content": user_input})
 
-    state = graph.invoke(state)
+    # Узлы графа асинхронные — синхронный вызов только через свой event loop
+    result = asyncio.run(graph.ainvoke(state))
 
-    if state.get("messages"):
-        last = state["messages"][-1]
+    if result.get("messages"):
+        last = result["messages"][-1]
         if last["role"] == "assistant":
             # print("Assistant:", last["content"])
+            state["messages"].append(last)
             return last["content"]
 
+
+async def astream_model(user_input: str, state, graph, config=None):
+    """
+    Асинхронный вариант quest_model: прогоняет граф через astream
+    и отдаёт токены ответа responder по мере их генерации.
+    Узлы графа асинхронные: ветки rag_agent и nl2sql_agent после
+    gate выполняются одновременно в одном event loop, так что
+    время ответа ≈ max(RAG, NL2SQL) + responder. config передаётся графу как есть
+    (например, thread_id для чекпоинтера).
+    """
+    if user_input.strip().lower() == "стоп":
+        yield "Assistant: Досвидания!"
+        return
+
+    state["messages"].append({"role": "user", "content": user_input})
+
+    streamed = False
+    final_state = None
+    async for mode, payload in graph.astream(state, config, stream_mode=["messages", "values"]):
+        if mode == "values":
+            final_state = payload
+            continue
+        chunk, metadata = payload
+        if metadata.get("langgraph_node") == "responder" and chunk.content:
+            streamed = True
+            yield chunk.content
+
+    if final_state:
+        # Прошёл ли ход через отказ (access=NO): такие ответы не кэшируются
+        state["access"] = final_state.get("access")
+    if final_state and final_state.get("messages"):
+        last = final_state["messages"][-1]
+        if last["role"] == "assistant":
+            # Сохраняем ответ в историю чата
+            state["messages"].append(last)
+            # Модель не отдала токены (например, без поддержки стриминга) — отдаём ответ целиком
+            if not streamed:
+                yield last["content"]
+
 '''
 def run():
     
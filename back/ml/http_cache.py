@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Awaitable, Callable, Iterator, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from app.config import settings
+
+
+DEFAULT_CACHE_PATH = Path(__file__).parent / "http_cache.sqlite3"
+
+
+def cache_key(url: str, params: Optional[dict] = None) -> str:
+    query = urlencode(sorted((params or {}).items()), doseq=True)
+    return hashlib.sha256(f"GET {url}?{query}".encode()).hexdigest()
+
+
+class HTTPCache:
+    """
+    Дисковый кэш ответов для загрузчиков Росстата и веба (ml/agents/r.py).
+
+    Ключ — URL и параметры запроса, тело хранится сжатым (zlib) в SQLite,
+    поэтому кэш переживает перезапуск и общий для всех воркеров. Пока запись
+    моложе ttl, сеть не трогается; устаревшая запись перепроверяется условным
+    запросом (If-None-Match / If-Modified-Since), а при ошибке сети
+    отдаётся как есть.
+    """
+
+    def __init__(self, path: Path, ttl: float):
+        self._path = str(path)
+        self._ttl = ttl
+        self._ready = False
+        # Метрики
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self._path, timeout=30)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL
+                )
+            """)
+            self._ready = True
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _lookup(self, url: str, params: Optional[dict] = None) -> Tuple[Optional[requests.Response], bool]:
+        """
+        Ответ из кэша и признак свежести; (None, False), если записи нет.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT url, status, headers, body, fetched_at FROM responses WHERE key = ?",
+                (cache_key(url, params),),
+            ).fetchone()
+        if row is None:
+            return None, False
+
+        response = requests.Response()
+        response.url, response.status_code = row[0], row[1]
+        response.headers = CaseInsensitiveDict(json.loads(row[2]))
+        response._content = zlib.decompress(row[3])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response, time.time() - row[4] < self._ttl
+
+    def _validators(self, response: requests.Response) -> dict:
+        headers = {}
+        if response.headers.get("ETag"):
+            headers["If-None-Match"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            headers["If-Modified-Since"] = response.headers["Last-Modified"]
+        return headers
+
+    def _store(self, url: str, params: Optional[dict], response: requests.Response) -> None:
+        headers = {
+            name: value for name, value in response.headers.items()
+            if name.lower() in ("content-type", "etag", "last-modified")
+        }
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    cache_key(url, params), response.url or url, response.status_code,
+                    json.dumps(headers), zlib.compress(response.content),
+                    headers.get("ETag"), headers.get("Last-Modified"), time.time(),
+                ),
+            )
+
+    def _touch(self, url: str, params: Optional[dict] = None) -> None:
+        # 304 Not Modified: запись снова свежая
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE responses SET fetched_at = ? WHERE key = ?", (time.time(), cache_key(url, params))
+            )
+
+    def get(self, url: str, params: Optional[dict],
+            download: Callable[[dict], requests.Response]) -> requests.Response:
+        """
+        Ответ по URL: из кэша, если он свежий, иначе через download(headers),
+        которому передаются заголовки условного запроса.
+        """
+        cached, fresh = self._lookup(url, params)
+        if cached is not None and fresh:
+            self.hits += 1
+            return cached
+
+        try:
+            response = download(self._validators(cached) if cached is not None else {})
+        except Exception:
+            if cached is None:
+                raise
+            # Источник недоступен — устаревший ответ лучше, чем никакого
+            self.hits += 1
+            return cached
+
+        if cached is not None and response.status_code == 304:
+            self._touch(url, params)
+            self.revalidated += 1
+            return cached
+        self.misses += 1
+        if response.status_code == 200:
+            self._store(url, params, response)
+        return response
+
+    async def aget(self, url: str, params: Optional[dict],
+                   download: Callable[[dict], Awaitable[requests.Response]]) -> requests.Response:
+        """
+        То же, что get, для асинхронного загрузчика (ml/fetcher.py);
+        SQLite читается и пишется в пуле потоков.
+        """
+        cached, fresh = await asyncio.to_thread(self._lookup, url, params)
+        if cached is not None and fresh:
+            self.hits += 1
+            return cached
+
+        try:
+            response = await download(self._validators(cached) if cached is not None else {})
+        except Exception:
+            if cached is None:
+                raise
+            self.hits += 1
+            return cached
+
+        if cached is not None and response.status_code == 304:
+            await asyncio.to_thread(self._touch, url, params)
+            self.revalidated += 1
+            return cached
+        self.misses += 1
+        if response.status_code == 200:
+            await asyncio.to_thread(self._store, url, params, response)
+        return response
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        return {
+            "hits_total": self.hits,
+            "revalidated_total": self.revalidated,
+            "misses_total": self.misses,
+        }
+
+
+http_cache = HTTPCache(settings.HTTP_CACHE_PATH or DEFAULT_CACHE_PATH, settings.HTTP_CACHE_TTL)
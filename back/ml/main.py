@@ -35,6 +35,8 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
+from app.config import settings
+
 
 llm = GigaChat(
     model='GigaChat-2-Max',
@@ -42,24 +44,29 @@ llm = GigaChat(
     verify_ssl_certs=False
 )
 
+def add_messages_window(left: list, right: list) -> list:
+    """
+    Редьюсер истории: дописывает новые сообщения и оставляет
+    только CHAT_HISTORY_LIMIT последних, чтобы чекпоинты не росли.
+    """
+    return (left + right)[-settings.CHAT_HISTORY_LIMIT:]
+
+
 class State(TypedDict):
-    messages: list
+    messages: Annotated[list, add_messages_window]
     message_type: str | None        
     access: str | None              
     web_search_context: str | None
     nl2sql_context: str | None
 
-class MessageClassifier(BaseModel):
-    message_type: Literal['formal', 'informal'] = Field(
+class MessageGate(BaseModel):
+    access: Literal['NO', 'YES'] = Field(
         ...,
-        description = 'Классификация'
+        description = 'Относится ли запрос к доменной области'
    )
-
-class MessageClarifier(BaseModel):
-    message_type: Literal['NO', 'YES'] = Field(
+    message_type: Literal['formal', 'informal'] = Field(
         ...,
-        description = 'Классификация'
+        description = 'Стиль ответа'
    )
 
-parser_classify = PydanticOutputParser(pydantic_object=MessageClassifier)
-parser_clarify = PydanticOutputParser(pydantic_object=MessageClarifier)
\ No newline at end of file
+parser_gate = PydanticOutputParser(pydantic_object=MessageGate)
\ No newline at end of file
@@ -0,0 +1,434 @@
+import asyncio
+import re
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.db import engine
+from ml.dataset import DatasetVersion, dataset_version
+
+
+# Слова, которые в названии региона обозначают его тип
+REGION_TYPE_PREFIXES = ("област", "кра", "республик", "автоном", "округ")
+
+# Города федерального значения в датасете — это только их внутригородские
+# территории (в Москве их больше сотни), отдельной строки для города нет,
+# поэтому такие названия разрешаются в регион целиком
+FEDERAL_CITIES = {
+    "Москва": ("москва", "мск"),
+    "Санкт-Петербург": ("санкт-петербург", "петербург", "питер", "спб"),
+    "Севастополь": ("севастополь",),
+}
+# Сколько букв окончания допускается после основы главного слова названия
+# или названия федерального города: «Питере», «Ростовом», но не «Питерский»
+MAX_NAME_ENDING = 2
+# Окончания прилагательных: «Нижний», «Великий», «Набережные» — не главное слово
+ADJECTIVE_ENDINGS = ("ий", "ый", "ой", "ая", "яя", "ое", "ее", "ие", "ые")
+
+MIN_TOKEN_LENGTH = 3
+MIN_STEM_LENGTH = 4
+# Сколько следующих слов вопроса просматривать для многословного названия
+MAX_NAME_SPAN = 4
+# Нечёткий поиск: минимальный коэффициент Дайса по триграммам
+FUZZY_THRESHOLD = 0.6
+FUZZY_SHORT_THRESHOLD = 0.5  # для слов до 4 букв при совпадении первых двух
+
+
+def tokenize(text: str) -> list:
+    return re.findall(r"[^\W\d_]+", text.lower().replace("ё", "е"))
+
+
+def stem(word: str) -> str:
+    """
+    Грубая основа для русских падежей: «Москве», «Москва» → «москв».
+    """
+    base = re.sub(r"[аеиоуыэюяьй]+$", "", word)
+    return base if len(base) >= MIN_STEM_LENGTH else word
+
+
+def name_stems(name: str) -> list:
+    return [stem(word) for word in tokenize(name) if len(word) >= MIN_TOKEN_LENGTH]
+
+
+def main_stem(name: str) -> Optional[str]:
+    """
+    Основа главного слова названия — первого, кроме прилагательных:
+    «Ростов-на-Дону» → «ростов», «Нижний Новгород» → «новгород».
+    У названий-прилагательных («Ростовский») главного слова нет.
+    """
+    for word in tokenize(name):
+        if len(word) >= MIN_TOKEN_LENGTH and not word.endswith(ADJECTIVE_ENDINGS):
+            return stem(word)
+    return None
+
+
+def trigrams(value: str) -> set:
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Municipality(NamedTuple):
+    territory_id: int
+    name: str
+    full_name: str
+    region: str
+    population: float
+
+
+class Mention(NamedTuple):
+    start: int
+    end: int
+    municipality: Municipality
+    fuzzy: bool = False
+    # Найдено по главному слову, и подходит несколько МО («Новгорода»)
+    ambiguous: bool = False
+
+
+class PrefixTrie:
+    """
+    Префиксное дерево основ: самая длинная основа, с которой начинается
+    слово вопроса, и все ключи с заданным префиксом (для подсказок).
+    """
+
+    def __init__(self):
+        self._root: dict = {}
+
+    def add(self, key: str, value) -> None:
+        node = self._root
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(value)
+
+    def longest_prefix(self, word: str) -> list:
+        node, found = self._root, []
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+    def complete(self, prefix: str) -> Iterator:
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for key, child in node.items():
+                if key is None:
+                    yield from child
+                else:
+                    stack.append(child)
+
+
+class TrigramIndex:
+    """
+    Нечёткий поиск по триграммам: опечатки и короткие формы («Уфе» → «Уфа»),
+    которые не ловятся основами.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, List[int]] = {}
+        self._keys: List[str] = []
+        self._grams: List[set] = []
+        self._values: List[list] = []
+        self._positions: Dict[str, int] = {}
+
+    def add(self, key: str, value) -> None:
+        position = self._positions.get(key)
+        if position is None:
+            position = self._positions[key] = len(self._keys)
+            grams = trigrams(key)
+            self._keys.append(key)
+            self._grams.append(grams)
+            self._values.append([])
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(position)
+        self._values[position].append(value)
+
+    def search(self, query: str, limit: int = 5) -> List[tuple]:
+        grams = trigrams(query)
+        counts: Dict[int, int] = {}
+        for gram in grams:
+            for position in self._postings.get(gram, ()):
+                counts[position] = counts.get(position, 0) + 1
+
+        scored = []
+        for position, common in counts.items():
+            score = 2 * common / (len(grams) + len(self._grams[position]))
+            key = self._keys[position]
+            short = min(len(query), len(key)) <= 4 and query[:2] == key[:2]
+            if score >= FUZZY_THRESHOLD or (short and score >= FUZZY_SHORT_THRESHOLD):
+                scored.append((score, position))
+        scored.sort(reverse=True)
+        return [(value, score) for score, position in scored[:limit] for value in self._values[position]]
+
+
+class MunicipalityIndex:
+    """
+    Поиск муниципалитетов и регионов по их упоминаниям в тексте вопроса.
+
+    Названия из municipal_districts приводятся к основам и раскладываются
+    в префиксное дерево, поэтому «в Ростове-на-Дону» и «Ростов-на-Дону» дают
+    один territory_id; опечатки и короткие названия добирает триграммный
+    индекс. Если одно название носят несколько МО («Октябрьский»), выбирается
+    самый крупный по населению (population_latest). Индекс строится при старте
+    API и перестраивается после смены версии датасета.
+    """
+
+    def __init__(self, engine: Engine, version: DatasetVersion):
+        self._engine = engine
+        self._trie: Optional[PrefixTrie] = None
+        self._fuzzy = TrigramIndex()
+        self._regions = PrefixTrie()
+        self._federal = PrefixTrie()
+        self._main: Dict[str, List[Municipality]] = {}
+        self._by_id: Dict[int, Municipality] = {}
+        self._by_region: Dict[str, List[int]] = {}
+        version.on_change(lambda _: self.clear())
+
+    def clear(self) -> None:
+        self._trie = None
+
+    def _query(self, conn, with_population: bool):
+        population = "COALESCE(p.population, 0)" if with_population else "0"
+        join = "LEFT JOIN population_latest p USING (territory_id)" if with_population else ""
+        return conn.execute(text(f"""
+            SELECT DISTINCT ON (m.territory_id)
+                m.territory_id, m.municipal_district_name_short,
+                m.municipal_district_name, m.region_name, {population}
+            FROM municipal_districts m {join}
+            WHERE m.territory_id IS NOT NULL
+            ORDER BY m.territory_id, m.year_to DESC
+        """)).all()
+
+    def _load(self) -> None:
+        try:
+            with self._engine.connect() as conn:
+                try:
+                    rows = self._query(conn, with_population=True)
+                except SQLAlchemyError:
+                    # Сводных таблиц ещё нет (старый датасет)
+                    conn.rollback()
+                    rows = self._query(conn, with_population=False)
+        except SQLAlchemyError:
+            rows = []
+
+        self.build([
+            Municipality(int(row[0]), row[1] or "", row[2] or "", row[3] or "", float(row[4] or 0))
+            for row in rows
+        ])
+
+    def build(self, municipalities: List[Municipality]) -> None:
+        """
+        Строит индекс по списку муниципалитетов (загрузка из базы, тесты).
+        """
+        municipalities = list(municipalities)
+        # Сначала крупные МО: при одинаковых названиях они идут первыми
+        municipalities.sort(key=lambda municipality: -municipality.population)
+
+        trie, fuzzy, regions, federal = PrefixTrie(), TrigramIndex(), PrefixTrie(), PrefixTrie()
+        by_id, by_region, main = {}, {}, {}
+        seen_regions = set()
+        for municipality in municipalities:
+            by_id[municipality.territory_id] = municipality
+            by_region.setdefault(municipality.region, []).append(municipality.territory_id)
+            stems = name_stems(municipality.name)
+            if stems:
+                trie.add(stems[0], (stems[1:], municipality))
+                fuzzy.add(" ".join(tokenize(municipality.name)), municipality)
+            key = main_stem(municipality.name)
+            if key is not None and len(key) >= MIN_STEM_LENGTH:
+                main.setdefault(key, []).append(municipality)
+
+            all_stems = name_stems(municipality.region)
+            region_stems = [s for s in all_stems if not s.startswith(REGION_TYPE_PREFIXES)]
+            if region_stems and municipality.region not in seen_regions:
+                seen_regions.add(municipality.region)
+                # Москва, Санкт-Петербург, Севастополь — без слова «область» в названии
+                typed = len(region_stems) < len(all_stems)
+                regions.add(region_stems[0], (region_stems[1:], municipality.region, typed))
+
+        for region, aliases in FEDERAL_CITIES.items():
+            if region in by_region:
+                for alias in aliases:
+                    stems = name_stems(alias)
+                    federal.add(stems[0], (stems, region))
+
+        self._fuzzy, self._regions, self._federal = fuzzy, regions, federal
+        self._by_id, self._by_region, self._main = by_id, by_region, main
+        self._trie = trie
+
+    def _ensure(self) -> PrefixTrie:
+        if self._trie is None:
+            self._load()
+        return self._trie
+
+    async def aload(self) -> None:
+        if self._trie is None:
+            await asyncio.to_thread(self._ensure)
+
+    @staticmethod
+    def _follows(words: list, start: int, stems: list) -> Optional[int]:
+        # Остальные слова названия идут подряд после первого
+        position = start + 1
+        for name_stem in stems:
+            while position < len(words) and len(words[position]) < MIN_TOKEN_LENGTH:
+                position += 1
+            if position >= len(words) or position - start > MAX_NAME_SPAN:
+                return None
+            if not words[position].startswith(name_stem):
+                return None
+            position += 1
+        return position
+
+    def _by_main_word(self, word: str) -> List[Municipality]:
+        # «Ростова» → «Ростов-на-Дону» без «на-Дону»; крупные МО первыми
+        for cut in range(MAX_NAME_ENDING + 1):
+            found = self._main.get(word[:len(word) - cut])
+            if found:
+                return found
+        return []
+
+    def _federal_span(self, words: list, start: int) -> Optional[tuple]:
+        # Город федерального значения по названию или сокращению («Питер», «СПб»)
+        for stems, region in self._federal.longest_prefix(words[start]):
+            end = self._follows(words, start, stems[1:])
+            if end is not None and len(words[end - 1]) - len(stems[-1]) <= MAX_NAME_ENDING:
+                return start, end, region
+        return None
+
+    def _region_spans(self, words: list) -> List[tuple]:
+        spans = []
+        for i, word in enumerate(words):
+            federal = self._federal_span(words, i)
+            if federal is not None:
+                spans.append(federal)
+                continue
+            for stems, region, typed in self._regions.longest_prefix(word):
+                end = self._follows(words, i, stems)
+                if end is None:
+                    continue
+                # Регион — только рядом со словом «область», «край», «республика»…
+                around = words[max(i - 1, 0):i] + words[end:end + 1]
+                if not typed or any(w.startswith(REGION_TYPE_PREFIXES) for w in around):
+                    spans.append((i, end, region))
+                    break
+        return spans
+
+    def find(self, query: str, fuzzy: bool = True) -> List[Mention]:
+        """
+        Муниципалитеты, упомянутые в вопросе, в порядке упоминания.
+        Если полного названия нет, слово сверяется с главными словами
+        названий («Ростова» → «Ростов-на-Дону», из нескольких — самый
+        крупный, ambiguous=True). Нечёткое совпадение ищется только для слов
+        с заглавной буквы (кроме первого слова вопроса).
+        """
+        trie = self._ensure()
+        words = tokenize(query)
+        capitalized = [raw[0].isupper() for raw in re.findall(r"[^\W\d_]+", query)]
+        taken = set()
+        for start, end, _ in self._region_spans(words):
+            taken.update(range(start, end))
+
+        mentions = []
+        i = 0
+        while i < len(words):
+            word = words[i]
+            if i in taken or len(word) < MIN_TOKEN_LENGTH:
+                i += 1
+                continue
+            match = None
+            for stems, municipality in trie.longest_prefix(word):
+                end = self._follows(words, i, stems)
+                if end is not None:
+                    match = Mention(i, end, municipality)
+                    break
+            if match is None:
+                candidates = self._by_main_word(word)
+                if candidates:
+                    match = Mention(i, i + 1, candidates[0], ambiguous=len(candidates) > 1)
+            if match is None and fuzzy and i > 0 and capitalized[i]:
+                found = self._fuzzy.search(word, limit=1)
+                if found:
+                    match = Mention(i, i + 1, found[0][0], fuzzy=True)
+            if match is None:
+                i += 1
+                continue
+            if all(m.municipality.territory_id != match.municipality.territory_id for m in mentions):
+                mentions.append(match)
+            i = match.end
+        return mentions
+
+    def federal_city(self, name: str) -> Optional[str]:
+        """
+        Регион, если название — город федерального значения или его
+        сокращение: «Москве» → «Москва», «СПб» → «Санкт-Петербург».
+        """
+        self._ensure()
+        words = tokenize(name)
+        span = self._federal_span(words, 0) if words else None
+        return span[2] if span is not None else None
+
+    def territories(self, region: str) -> List[int]:
+        """
+        Все territory_id региона (для города федерального значения —
+        его внутригородские территории).
+        """
+        self._ensure()
+        return list(self._by_region.get(region, []))
+
+    def resolve(self, name: str, limit: int = 5) -> List[tuple]:
+        """
+        Кандидаты (Municipality, score) для названия: точное совпадение основ,
+        совпадение главного слова (как в find), затем названия с таким
+        началом, затем нечёткие совпадения.
+        Для города федерального значения отдельного МО нет — пустой список,
+        его нужно искать через federal_city().
+        """
+        trie = self._ensure()
+        results: Dict[int, tuple] = {}
+        if self.federal_city(name) is not None:
+            return []
+
+        def add(municipality: Municipality, score: float) -> None:
+            if municipality.territory_id not in results:
+                results[municipality.territory_id] = (municipality, score)
+
+        words = tokenize(name)
+        if words:
+            for stems, municipality in trie.longest_prefix(words[0]):
+                if self._follows(words, 0, stems) is not None:
+                    add(municipality, 1.0)
+            for municipality in self._by_main_word(words[0]):
+                add(municipality, 0.95)
+            completions = [m for _, m in trie.complete(stem(words[0]))]
+            for municipality in sorted(completions, key=lambda m: -m.population):
+                add(municipality, 0.9)
+            for municipality, score in self._fuzzy.search(" ".join(words), limit=limit):
+                add(municipality, round(score, 2))
+        return sorted(results.values(), key=lambda item: -item[1])[:limit]
+
+    def get(self, territory_id: int) -> Optional[Municipality]:
+        self._ensure()
+        return self._by_id.get(territory_id)
+
+    def find_regions(self, query: str) -> List[str]:
+        self._ensure()
+        return [region for _, _, region in self._region_spans(tokenize(query))]
+
+    async def afind(self, query: str, fuzzy: bool = True) -> List[Mention]:
+        await self.aload()
+        return self.find(query, fuzzy)
+
+    async def afind_regions(self, query: str) -> List[str]:
+        await self.aload()
+        return self.find_regions(query)
+
+
+municipality_index = MunicipalityIndex(engine, dataset_version)
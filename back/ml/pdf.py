@@ -0,0 +1,60 @@
+from io import BytesIO
+from typing import List, Tuple
+
+from PyPDF2 import PdfReader
+
+from app.config import settings
+from app.process_pool import BoundedProcessPool, ProcessPoolFull
+
+
+class PDFQueueFull(Exception):
+    pass
+
+
+def extract_pages(content: bytes, max_pages: int, max_chars: int) -> List[Tuple[int, str]]:
+    """
+    Текст PDF по страницам: страницы разбираются по одной и только пока не
+    исчерпан бюджет страниц и символов, поэтому бюллетень на сотни страниц
+    не разбирается целиком. Возвращает [(номер страницы, текст)].
+    """
+    reader = PdfReader(BytesIO(content))
+    pages, total = [], 0
+    for number, page in enumerate(reader.pages, 1):
+        if number > max_pages or total >= max_chars:
+            break
+        text = (page.extract_text() or "")[:max_chars - total]
+        total += len(text)
+        if text.strip():
+            pages.append((number, text))
+    return pages
+
+
+class PDFExtractor:
+    """
+    Разбор PDF в отдельном пуле процессов (app/process_pool.py): extract_text
+    нагружает CPU и в потоке держал бы GIL, тормозя event loop сервера.
+    Одновременно в работе и в очереди не больше max_pending документов,
+    остальные сразу получают PDFQueueFull.
+    """
+
+    def __init__(self, workers: int, max_pending: int, max_pages: int, max_chars: int):
+        self._pool = BoundedProcessPool(workers, max_pending)
+        self._max_pages = max_pages
+        self._max_chars = max_chars
+
+    async def extract(self, content: bytes) -> List[Tuple[int, str]]:
+        try:
+            return await self._pool.run(extract_pages, content, self._max_pages, self._max_chars)
+        except ProcessPoolFull:
+            raise PDFQueueFull("очередь разбора PDF переполнена")
+
+    def shutdown(self) -> None:
+        self._pool.shutdown()
+
+
+pdf_extractor = PDFExtractor(
+    workers=settings.PDF_WORKERS,
+    max_pending=settings.PDF_QUEUE,
+    max_pages=settings.PDF_MAX_PAGES,
+    max_chars=settings.PDF_MAX_CHARS,
+)
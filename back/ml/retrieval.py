@@ -0,0 +1,333 @@
+import asyncio
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+from app.config import settings
+from ml.municipalities import stem, tokenize
+
+
+DEFAULT_INDEX_DIR = Path(__file__).parent / "rag_index"
+CHUNKS_FILE = "chunks.jsonl"
+EMBEDDINGS_FILE = "embeddings.f32"
+POSTINGS_FILE = "bm25.npz"
+TERMS_FILE = "terms.json"
+META_FILE = "meta.json"
+
+# Фрагменты документов
+CHUNK_CHARS = 800
+# Плотные векторы: хэшированные символьные n-граммы слов
+EMBEDDING_DIM = 256
+NGRAM_SIZES = (3, 4, 5)
+# Ниже этой близости совпадение хэшированных векторов — шум
+DENSE_MIN_SCORE = 0.3
+# BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Сколько кандидатов каждого ранжирования идёт в слияние (reciprocal rank fusion)
+FUSION_CANDIDATES = 50
+FUSION_K = 60
+MIN_TERM_LENGTH = 2
+
+
+class Chunk(NamedTuple):
+    source: str
+    title: str
+    text: str
+
+
+class SearchResult(NamedTuple):
+    chunk: Chunk
+    score: float
+
+
+def terms(text: str) -> list:
+    return [stem(word) for word in tokenize(text) if len(word) >= MIN_TERM_LENGTH]
+
+
+def split_text(text: str, size: int = CHUNK_CHARS) -> List[str]:
+    """
+    Фрагменты до size символов по границам абзацев, длинные абзацы — по предложениям.
+    """
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if len(paragraph) <= size:
+            pieces.append(paragraph)
+        else:
+            pieces += re.split(r"(?<=[.!?…])\s+", paragraph)
+
+    chunks, current = [], ""
+    for piece in filter(None, pieces):
+        if current and len(current) + len(piece) + 1 > size:
+            chunks.append(current)
+            current = ""
+        while len(piece) > size:
+            chunks.append(piece[:size])
+            piece = piece[size:]
+        current = f"{current} {piece}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def embed(texts: Iterable[str]) -> np.ndarray:
+    """
+    Векторы без внешней модели: символьные n-граммы слов хэшируются
+    в EMBEDDING_DIM измерений со знаком (feature hashing), затем
+    нормируются. Ловят общие корни и опечатки, которые BM25 пропускает.
+    """
+    texts = list(texts)
+    vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in tokenize(text):
+            padded = f" {word} "
+            for n in NGRAM_SIZES:
+                for i in range(len(padded) - n + 1):
+                    code = zlib.crc32(padded[i:i + n].encode())
+                    vectors[row, code % EMBEDDING_DIM] += 1.0 if code & 0x80000000 else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def bm25_postings(chunks: List[Chunk]) -> tuple:
+    # Постинги BM25 в формате CSR: фрагменты термина i —
+    # doc_ids[offsets[i]:offsets[i + 1]] с частотами tfs[...]
+    postings: Dict[str, Dict[int, int]] = {}
+    lengths = np.zeros(len(chunks), dtype=np.float32)
+    for position, chunk in enumerate(chunks):
+        words = terms(chunk.title + " " + chunk.text)
+        lengths[position] = len(words)
+        for word in words:
+            counts = postings.setdefault(word, {})
+            counts[position] = counts.get(position, 0) + 1
+
+    vocabulary = sorted(postings)
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[word]) for word in vocabulary])
+    doc_ids = np.fromiter(
+        (position for word in vocabulary for position in postings[word]), dtype=np.int32, count=offsets[-1]
+    )
+    tfs = np.fromiter(
+        (count for word in vocabulary for count in postings[word].values()), dtype=np.float32, count=offsets[-1]
+    )
+    return vocabulary, offsets, doc_ids, tfs, lengths
+
+
+def _write_postings(chunks: List[Chunk], path: Path) -> None:
+    vocabulary, offsets, doc_ids, tfs, lengths = bm25_postings(chunks)
+    with open(path / (POSTINGS_FILE + ".tmp"), "wb") as f:
+        np.savez(f, offsets=offsets, doc_ids=doc_ids, tfs=tfs, lengths=lengths)
+    with open(path / (TERMS_FILE + ".tmp"), "w", encoding="utf-8") as f:
+        json.dump(vocabulary, f, ensure_ascii=False)
+
+
+def build_index(chunks: Iterable[Chunk], path: Path) -> int:
+    """
+    Записывает индекс: фрагменты (JSONL), постинги BM25, матрицу векторов
+    (float32 для np.memmap) и meta.json. meta.json пишется последним,
+    поэтому недостроенный индекс не открывается.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    chunks = list(chunks)
+
+    with open(path / (CHUNKS_FILE + ".tmp"), "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(json.dumps(chunk._asdict(), ensure_ascii=False) + "\n")
+
+    vectors = np.memmap(
+        path / (EMBEDDINGS_FILE + ".tmp"), dtype=np.float32, mode="w+",
+        shape=(max(len(chunks), 1), EMBEDDING_DIM),
+    )
+    for start in range(0, len(chunks), 1024):
+        batch = chunks[start:start + 1024]
+        vectors[start:start + len(batch)] = embed(chunk.title + " " + chunk.text for chunk in batch)
+    vectors.flush()
+    del vectors
+    _write_postings(chunks, path)
+
+    for name in (CHUNKS_FILE, EMBEDDINGS_FILE, POSTINGS_FILE, TERMS_FILE):
+        os.replace(path / (name + ".tmp"), path / name)
+    meta = {"count": len(chunks), "dim": EMBEDDING_DIM, "built": time.time()}
+    with open(path / (META_FILE + ".tmp"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path / (META_FILE + ".tmp"), path / META_FILE)
+    return len(chunks)
+
+
+def read_documents(directory: Path) -> Iterable[Chunk]:
+    """
+    Фрагменты из .txt/.md файлов корпуса; заголовок — первая строка файла.
+    """
+    for file in sorted(Path(directory).rglob("*")):
+        if file.suffix.lower() not in (".txt", ".md") or not file.is_file():
+            continue
+        text = file.read_text(encoding="utf-8", errors="ignore")
+        title = text.strip().split("\n", 1)[0].lstrip("# ").strip() or file.stem
+        for piece in split_text(text):
+            yield Chunk(str(file.relative_to(directory)), title, piece)
+
+
+class RetrievalIndex:
+    """
+    Локальный гибридный поиск по корпусу муниципальных документов вместо
+    живых запросов к Википедии и Росстату: BM25 по основам слов и косинусная
+    близость хэшированных векторов, результаты сливаются по рангам (RRF).
+
+    Матрица векторов открывается через np.memmap только на чтение: индекс
+    открывается быстро, а страницы файла в кэше ОС общие для всех воркеров
+    uvicorn. Постинги BM25 хранятся готовыми массивами и тоже не
+    пересчитываются при открытии.
+    """
+
+    def __init__(self, path: Path):
+        self._path = Path(path)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._chunks: List[Chunk] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._terms: Dict[str, int] = {}
+        self._offsets = self._doc_ids = self._tfs = None
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._avg_length = 0.0
+        # Метрики
+        self.searches = 0
+        self.seconds = 0.0
+
+    def _load(self) -> None:
+        meta_path = self._path / META_FILE
+        if not meta_path.exists():
+            return
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(self._path / CHUNKS_FILE, encoding="utf-8") as f:
+            chunks = [Chunk(**json.loads(line)) for line in f]
+        if not chunks or meta["count"] != len(chunks):
+            return
+        vectors = np.memmap(
+            self._path / EMBEDDINGS_FILE, dtype=np.float32, mode="r",
+            shape=(meta["count"], meta["dim"]),
+        )
+
+        with open(self._path / TERMS_FILE, encoding="utf-8") as f:
+            vocabulary = json.load(f)
+        with np.load(self._path / POSTINGS_FILE) as postings:
+            self._set(
+                chunks, vectors, vocabulary, postings["offsets"], postings["doc_ids"],
+                postings["tfs"], postings["lengths"],
+            )
+
+    def _set(self, chunks, vectors, vocabulary, offsets, doc_ids, tfs, lengths) -> None:
+        self._terms = {word: i for i, word in enumerate(vocabulary)}
+        self._offsets, self._doc_ids, self._tfs = offsets, doc_ids, tfs
+        self._lengths = lengths
+        self._avg_length = float(lengths.mean()) or 1.0
+        self._chunks, self._vectors = chunks, vectors
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Chunk]) -> "RetrievalIndex":
+        """
+        Индекс в памяти без файлов — для ранжирования только что
+        загруженных документов (ml/agents/r.py).
+        """
+        index = cls(Path())
+        index._loaded = True
+        if chunks:
+            index._set(chunks, embed(chunk.title + " " + chunk.text for chunk in chunks), *bm25_postings(chunks))
+        return index
+
+    def _ensure(self) -> None:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+                    self._loaded = True
+
+    async def aload(self) -> None:
+        await asyncio.to_thread(self._ensure)
+
+    def reload(self) -> None:
+        with self._lock:
+            self._loaded = False
+
+    def _bm25(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self._chunks), dtype=np.float32)
+        total = len(self._chunks)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths / self._avg_length)
+        for word in set(terms(query)):
+            term = self._terms.get(word)
+            if term is None:
+                continue
+            start, end = self._offsets[term], self._offsets[term + 1]
+            positions, counts = self._doc_ids[start:end], self._tfs[start:end]
+            idf = math.log(1 + (total - len(positions) + 0.5) / (len(positions) + 0.5))
+            scores[positions] += idf * counts * (BM25_K1 + 1) / (counts + norm[positions])
+        return scores
+
+    @staticmethod
+    def _top(scores: np.ndarray, limit: int, min_score: float = 0.0) -> np.ndarray:
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return top[scores[top] > min_score]
+
+    def search(self, query: str, k: int = 4) -> List[SearchResult]:
+        self._ensure()
+        if not self._chunks:
+            return []
+        started = time.perf_counter()
+
+        lexical = self._top(self._bm25(query), FUSION_CANDIDATES)
+        dense = self._top(self._vectors @ embed([query])[0], FUSION_CANDIDATES, DENSE_MIN_SCORE)
+        fused: Dict[int, float] = {}
+        for ranking in (lexical, dense):
+            for rank, position in enumerate(ranking.tolist()):
+                fused[position] = fused.get(position, 0.0) + 1.0 / (FUSION_K + rank + 1)
+        best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+
+        self.searches += 1
+        self.seconds += time.perf_counter() - started
+        return [SearchResult(self._chunks[position], round(score, 4)) for position, score in best]
+
+    def stats(self) -> dict:
+        return {
+            "chunks": len(self._chunks),
+            "searches_total": self.searches,
+            "search_seconds_total": round(self.seconds, 3),
+        }
+
+
+retrieval_index = RetrievalIndex(settings.RAG_INDEX_DIR or DEFAULT_INDEX_DIR)
+
+
+def rank_chunks(query: str, chunks: List[Chunk], k: int = 4) -> List[SearchResult]:
+    return RetrievalIndex.from_chunks(chunks).search(query, k)
+
+
+def rag_sys(query: str) -> str:
+    """
+    Контекст для rag_agent: лучшие фрагменты корпуса с указанием источника.
+    """
+    results = retrieval_index.search(query, k=settings.RAG_TOP_K)
+    return "\n\n".join(
+        f"[{i}] {result.chunk.title} ({result.chunk.source})\n{result.chunk.text}"
+        for i, result in enumerate(results, 1)
+    )
+
+
+if __name__ == "__main__":
+    # python -m ml.retrieval <каталог с .txt/.md> [каталог индекса]
+    corpus = Path(sys.argv[1])
+    target = Path(sys.argv[2]) if len(sys.argv) > 2 else Path(settings.RAG_INDEX_DIR or DEFAULT_INDEX_DIR)
+    print(f"{build_index(read_documents(corpus), target)} chunks -> {target}")
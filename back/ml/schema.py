@@ -0,0 +1,141 @@
+import asyncio
+from typing import Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.db import engine
+from ml.dataset import DatasetVersion, dataset_version
+
+
+# Таблицы датасета, которые видит NL2SQL-агент (dataset/convert.py)
+SCHEMA_TABLES = (
+    "market_access",
+    "bdmo_population",
+    "bdmo_migration",
+    "bdmo_salary",
+    "connection",
+    "consumption",
+    "municipal_districts",
+)
+
+# Сводные таблицы, которые строит dataset/convert.py: агенту стоит начинать с них
+SUMMARY_TABLES = {
+    "salary_avg": "average monthly salary (RUB) per territory and industry over 2023-2024, the default period; "
+                  "each year counts once, by its most complete period (январь-декабрь when available)",
+    "salary_avg_year": "average monthly salary (RUB) per territory, year and industry for the most complete period "
+                       "of the year (column period, январь-декабрь when available); periods are cumulative, never average them",
+    "consumption_avg": "average cashless spending per ONE person per month over 2023-2024, the default period",
+    "consumption_avg_year": "average cashless spending per ONE person per month per territory, year and category",
+    "population_latest": "agglomeration population (all ages, both genders) for the latest available year",
+    "migration_balance": "net migration (all ages, both genders) per territory and year",
+}
+
+SAMPLE_ROWS = 2
+# Текстовые колонки с таким числом значений и меньше перечисляются целиком
+MAX_CATEGORIES = 24
+MAX_VALUE_LENGTH = 40
+
+
+def _short(value) -> str:
+    value = str(value)
+    return value if len(value) <= MAX_VALUE_LENGTH else value[:MAX_VALUE_LENGTH] + "…"
+
+
+class SchemaDigest:
+    """
+    Компактное описание таблиц датасета для промпта NL2SQL: колонки с типами,
+    примерная численность, пара строк-примеров и допустимые значения
+    категориальных колонок (period, gender, age и т.п.). Сводные таблицы идут
+    первыми, с пояснением. С ним агенту не нужны
+    шаги sql_db_list_tables / sql_db_schema. Строится один раз и
+    перестраивается после смены версии датасета.
+    """
+
+    def __init__(self, engine: Engine, version: DatasetVersion,
+                 tables=tuple(SUMMARY_TABLES) + SCHEMA_TABLES):
+        self._engine = engine
+        self._version = version
+        self._tables = tables
+        self._value: Optional[str] = None
+        version.on_change(lambda _: self.clear())
+
+    def clear(self) -> None:
+        self._value = None
+
+    def _describe(self, conn: Connection, table: str, columns: list, seen: dict) -> str:
+        quoted = f'"{table}"'
+        names = [column["name"] for column in columns]
+
+        rows = conn.execute(text(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)"
+        ), {"table": table}).scalar()
+        header = ", ".join(f"{column['name']} {column['type']}" for column in columns)
+        lines = [f"{table}({header})" + (f" ~{rows} rows" if rows and rows > 0 else "")]
+        if table in SUMMARY_TABLES:
+            lines.append(f"  -- {SUMMARY_TABLES[table]}")
+
+        categories = []
+        for column in columns:
+            if column["type"].python_type is not str:
+                continue
+            values = conn.execute(text(
+                f'SELECT DISTINCT "{column["name"]}" FROM {quoted} '
+                f'WHERE "{column["name"]}" IS NOT NULL LIMIT {MAX_CATEGORIES + 1}'
+            )).scalars().all()
+            if len(values) > MAX_CATEGORIES:
+                continue
+            # Одинаковые списки (okved_name, category...) в сводных и исходных таблицах не повторяем
+            listing = ", ".join(_short(v) for v in sorted(values))
+            key = (column["name"], listing)
+            if key in seen:
+                categories.append(f"{column['name']}: as in {seen[key]}")
+            else:
+                seen[key] = table
+                categories.append(f"{column['name']}: {listing}")
+        if categories:
+            lines.append("  values: " + "; ".join(categories))
+
+        sample = conn.execute(text(f"SELECT * FROM {quoted} LIMIT {SAMPLE_ROWS}")).all()
+        for row in sample:
+            lines.append("  sample: " + ", ".join(
+                f"{name}={_short(value)}" for name, value in zip(names, row)
+            ))
+        return "\n".join(lines)
+
+    def build(self) -> str:
+        parts = []
+        seen = {}
+        with self._engine.connect() as conn:
+            inspector = inspect(conn)
+            existing = set(inspector.get_table_names())
+            for table in self._tables:
+                if table not in existing:
+                    continue
+                try:
+                    parts.append(self._describe(conn, table, inspector.get_columns(table), seen))
+                except (SQLAlchemyError, NotImplementedError):
+                    conn.rollback()
+                    parts.append(table)
+        if any(table in SUMMARY_TABLES for table in existing):
+            parts.insert(0, (
+                "Pre-aggregated tables come first: prefer them over the raw tables for default-period "
+                "questions, join municipal_districts by territory_id for names."
+            ))
+        return "\n\n".join(parts)
+
+    def get(self) -> str:
+        self._version.get()
+        if self._value is None:
+            self._value = self.build()
+        return self._value
+
+    async def aget(self) -> str:
+        await self._version.aget()
+        if self._value is None:
+            self._value = await asyncio.to_thread(self.build)
+        return self._value
+
+
+schema_digest = SchemaDigest(engine, dataset_version)
@@ -0,0 +1,105 @@
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable
+
+from app.config import settings
+from ml.dataset import DatasetVersion, dataset_version
+
+
+_SQL_TOKENS = re.compile(
+    r"""('(?:[^']|'')*')"""        # строковый литерал — без изменений
+    r'''|("(?:[^"]|"")*")'''       # идентификатор в кавычках — без изменений
+    r"|(--[^\n]*|/\*.*?\*/)"       # комментарий — выбрасываем
+    r"|(\s+)"                      # пробелы — схлопываем
+    r"|([^'\"\s-]+|-)",
+    re.S,
+)
+
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Ключ кэша: регистр, пробелы, комментарии и завершающая «;» не различаются,
+    строковые литералы и идентификаторы в кавычках сохраняются как есть.
+    """
+    parts = []
+    for literal, quoted, comment, space, word in _SQL_TOKENS.findall(sql.strip().strip("`")):
+        if literal or quoted:
+            parts.append(literal or quoted)
+        elif space or comment:
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        else:
+            parts.append(word.lower())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+class SQLResultCache:
+    """
+    Кэш результатов sql_db_query NL2SQL-агента. Ключ — канонизированный SQL,
+    записи привязаны к версии датасета и хранятся сжатыми (zlib); при
+    превышении max_bytes вытесняются давно не использованные (LRU).
+    Инструменты агента работают в пуле потоков, поэтому доступ под локом.
+    """
+
+    def __init__(self, version: DatasetVersion, max_bytes: int):
+        self._version = version
+        self._max_bytes = max_bytes
+        self._items: "OrderedDict[str, tuple[str, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        version.on_change(lambda _: self.clear())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def _get(self, key: str, version: str):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] != version:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return zlib.decompress(item[1]).decode()
+
+    def _put(self, key: str, version: str, result: str) -> None:
+        data = zlib.compress(result.encode())
+        if len(data) > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous[1])
+            self._items[key] = (version, data)
+            self._bytes += len(data)
+            while self._bytes > self._max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def run(self, sql: str, execute: Callable[[], str]) -> str:
+        key = canonicalize_sql(sql)
+        version = self._version.get()
+        result = self._get(key, version)
+        if result is None:
+            result = execute()
+            # Ошибки не кэшируем: агент перепишет запрос
+            if not result.startswith("Error:"):
+                self._put(key, version, result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "hits_total": self.hits,
+            "misses_total": self.misses,
+            "size": len(self._items),
+            "bytes": self._bytes,
+        }
+
+
+sql_result_cache = SQLResultCache(dataset_version, settings.SQL_CACHE_MAX_BYTES)
@@ -0,0 +1,130 @@
+import json
+import re
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+
+from app.config import settings
+
+
+_LITERALS = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|--[^\n]*|/\*.*?\*/""", re.S)
+
+# SQLSTATE query_canceled: сработал statement_timeout
+QUERY_CANCELED = "57014"
+
+
+def rejection(error: str, message: str, hint: str) -> str:
+    """
+    Наблюдение для агента: префикс «Error:» (как у SQLDatabase, такие ответы
+    не кэшируются) и JSON с причиной и подсказкой, как исправить запрос.
+    """
+    return "Error: " + json.dumps(
+        {"error": error, "message": message, "hint": hint}, ensure_ascii=False
+    )
+
+
+class GuardedSQLExecutor:
+    """
+    Исполнение SQL, написанного LLM: одна инструкция SELECT/WITH в read-only
+    транзакции с statement_timeout, предварительная проверка оценки стоимости
+    через EXPLAIN и ограничение числа строк в ответе. Отказы возвращаются
+    агенту как наблюдения, а не исключения.
+    """
+
+    def __init__(self, engine: Engine, statement_timeout: int, max_cost: float, max_rows: int):
+        self._engine = engine
+        self._statement_timeout = statement_timeout
+        self._max_cost = max_cost
+        self._max_rows = max_rows
+        # Метрики
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _check_statement(self, sql: str):
+        code = _LITERALS.sub("''", sql)
+        if ";" in code:
+            return rejection(
+                "multiple_statements",
+                "Only one SQL statement per call is allowed.",
+                "Send a single SELECT without ';' inside it.",
+            )
+        words = code.split()
+        if not words or words[0].lower() not in ("select", "with"):
+            return rejection(
+                "not_select",
+                "Only read-only SELECT queries are allowed.",
+                "Rewrite the request as a SELECT (or WITH ... SELECT) query.",
+            )
+        return None
+
+    def run(self, sql: str) -> str:
+        sql = sql.strip().strip("`").strip().rstrip(";").strip()
+        error = self._check_statement(sql)
+        if error is not None:
+            self.rejected += 1
+            return error
+
+        with self._engine.connect() as conn:
+            try:
+                conn.execute(text("SET TRANSACTION READ ONLY"))
+                conn.execute(text(f"SET LOCAL statement_timeout = {int(self._statement_timeout)}"))
+
+                plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                cost = plan[0]["Plan"]["Total Cost"]
+                if cost > self._max_cost:
+                    self.rejected += 1
+                    return rejection(
+                        "cost_limit",
+                        f"Estimated query cost {cost:.0f} exceeds the limit {self._max_cost:.0f}.",
+                        "Filter by territory_id/year, aggregate, use the pre-aggregated tables "
+                        "and avoid joins of large tables (e.g. connection with itself).",
+                    )
+
+                result = conn.execute(text(sql))
+                if not result.returns_rows:
+                    return ""
+                rows = result.fetchmany(self._max_rows + 1)
+            except DBAPIError as exc:
+                code = getattr(exc.orig, "pgcode", None) or getattr(exc.orig, "sqlstate", None)
+                if code == QUERY_CANCELED:
+                    self.timeouts += 1
+                    return rejection(
+                        "timeout",
+                        f"The query was cancelled after {self._statement_timeout} ms.",
+                        "Make the query cheaper: add filters, aggregate, use LIMIT.",
+                    )
+                return rejection("sql_error", str(exc.orig).strip().splitlines()[0], "Fix the query and try again.")
+            except SQLAlchemyError as exc:
+                return rejection("sql_error", str(exc).splitlines()[0], "Fix the query and try again.")
+            finally:
+                conn.rollback()
+
+        truncated = len(rows) > self._max_rows
+        output = str([tuple(row) for row in rows[:self._max_rows]])
+        if truncated:
+            output += f"\n(only the first {self._max_rows} rows are shown; add LIMIT or aggregate)"
+        return output
+
+    def stats(self) -> dict:
+        return {
+            "rejected_total": self.rejected,
+            "timeouts_total": self.timeouts,
+        }
+
+
+# Отдельный пул: запросы агента не занимают соединения API
+nl2sql_engine = create_engine(
+    settings.get_nl2sql_db_url(),
+    pool_size=settings.NL2SQL_POOL_SIZE,
+    max_overflow=settings.NL2SQL_MAX_OVERFLOW,
+    pool_pre_ping=True,
+)
+sql_guard = GuardedSQLExecutor(
+    nl2sql_engine,
+    statement_timeout=settings.NL2SQL_STATEMENT_TIMEOUT,
+    max_cost=settings.NL2SQL_MAX_COST,
+    max_rows=settings.NL2SQL_MAX_ROWS,
+)
@@ -0,0 +1,33 @@
+from langchain_community.agent_toolkits import SQLDatabaseToolkit
+from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
+from langchain_community.utilities import SQLDatabase
+
+from ml.sql_cache import sql_result_cache
+from ml.sql_guard import sql_guard
+
+
+QUERY_TOOL_NAME = "sql_db_query"
+
+
+class CachedQuerySQLDatabaseTool(QuerySQLDatabaseTool):
+    """
+    sql_db_query через защищённый исполнитель (ml/sql_guard.py) с кэшем
+    результатов (ml/sql_cache.py): одинаковые запросы агента разных
+    пользователей не доходят до базы повторно.
+    """
+
+    def _run(self, query: str, run_manager=None) -> str:
+        return sql_result_cache.run(query, lambda: sql_guard.run(query))
+
+
+def build_sql_tools(db: SQLDatabase, llm) -> list:
+    """
+    Инструменты SQLDatabaseToolkit, в которых sql_db_query заменён на
+    CachedQuerySQLDatabaseTool. Замена — по имени инструмента: класс
+    в toolkit менялся между версиями langchain-community
+    (QuerySQLDataBaseTool → QuerySQLDatabaseTool).
+    """
+    return [
+        CachedQuerySQLDatabaseTool(db=db) if tool.name == QUERY_TOOL_NAME else tool
+        for tool in SQLDatabaseToolkit(db=db, llm=llm).get_tools()
+    ]
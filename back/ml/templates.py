@@ -0,0 +1,313 @@
+import asyncio
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from ml.municipalities import MIN_STEM_LENGTH, Mention, MunicipalityIndex, municipality_index, tokenize
+from ml.sql_guard import nl2sql_engine
+
+
+class Metric(NamedTuple):
+    title: str
+    keywords: Tuple[str, ...]
+    # Подзапрос (territory_id, value, period) за весь период и по годам (:years)
+    total_sql: str
+    years_sql: str
+    digits: int = 0
+
+
+METRICS: Dict[str, Metric] = {
+    "population": Metric(
+        title="Численность населения (агломерация), чел.",
+        keywords=("населени", "численност", "жител", "людей", "прожива"),
+        total_sql="SELECT territory_id, population AS value, CAST(year AS TEXT) AS period FROM population_latest",
+        years_sql="""
+            SELECT territory_id, SUM(value) AS value, CAST(year AS TEXT) AS period
+            FROM (
+                SELECT territory_id, year, gender, AVG(value) AS value
+                FROM bdmo_population
+                WHERE year = ANY(:years) AND age = 'Всего'
+                GROUP BY territory_id, year, gender
+            ) by_gender
+            GROUP BY territory_id, year
+        """,
+    ),
+    "salary": Metric(
+        title="Средняя заработная плата, руб. в месяц; отрасль: {okved}",
+        keywords=("зарплат", "заработн", "оклад"),
+        total_sql="""
+            SELECT territory_id, avg_salary AS value, '2023–2024' AS period
+            FROM salary_avg WHERE okved_name = :okved
+        """,
+        years_sql="""
+            SELECT territory_id, avg_salary AS value, CAST(year AS TEXT) AS period
+            FROM salary_avg_year WHERE okved_name = :okved AND year = ANY(:years)
+        """,
+    ),
+    "consumption": Metric(
+        title="Средние безналичные траты на ОДНОГО человека в месяц, руб.; категория: {category}",
+        keywords=("потреблени", "расход", "трат", "покупк"),
+        total_sql="""
+            SELECT territory_id, avg_value AS value, '2023–2024' AS period
+            FROM consumption_avg WHERE category = :category
+        """,
+        years_sql="""
+            SELECT territory_id, avg_value AS value, CAST(year AS TEXT) AS period
+            FROM consumption_avg_year WHERE category = :category AND year = ANY(:years)
+        """,
+    ),
+    "migration": Metric(
+        title="Миграционный прирост, чел.",
+        keywords=("миграц", "мигрант", "приезж", "переезж", "отток", "приток"),
+        total_sql="""
+            SELECT territory_id, SUM(balance) AS value,
+                CASE WHEN MIN(year) = MAX(year) THEN CAST(MIN(year) AS TEXT)
+                     ELSE MIN(year) || '–' || MAX(year) END AS period
+            FROM migration_balance GROUP BY territory_id
+        """,
+        years_sql="""
+            SELECT territory_id, balance AS value, CAST(year AS TEXT) AS period
+            FROM migration_balance WHERE year = ANY(:years)
+        """,
+    ),
+    "market_access": Metric(
+        title="Индекс доступности рынков (выше — перспективнее)",
+        keywords=("доступност",),
+        total_sql="SELECT territory_id, market_access AS value, NULL AS period FROM market_access",
+        years_sql="",
+        digits=1,
+    ),
+}
+
+CATEGORIES = {
+    "продовольств": "Продовольствие", "продукт": "Продовольствие", "ед": "Продовольствие",
+    "здоровь": "Здоровье", "медицин": "Здоровье", "аптек": "Здоровье",
+    "маркетплейс": "Маркетплейсы",
+    "общепит": "Общественное питание", "ресторан": "Общественное питание", "кафе": "Общественное питание",
+    "транспорт": "Транспорт", "такси": "Транспорт",
+}
+
+OKVED = {
+    "образовани": "Образование", "учител": "Образование",
+    "здравоохранени": "Здравоохранение", "медицин": "Здравоохранение", "врач": "Здравоохранение",
+    "строител": "Строительство", "торговл": "Торговля",
+    "сельск": "Сельское хозяйство", "аграр": "Сельское хозяйство",
+    "айти": "ИТ и связь", "связ": "ИТ и связь", "программист": "ИТ и связь",
+    "финанс": "Финансы и страхование", "банк": "Финансы и страхование", "страхов": "Финансы и страхование",
+    "транспорт": "Транспортировка и хранение", "логист": "Транспортировка и хранение",
+    "добыч": "Добыча полезных ископаемых", "нефт": "Добыча полезных ископаемых",
+    "обрабатывающ": "Обрабатывающие производства", "промышленн": "Обрабатывающие производства",
+    "госуправлени": "Гос. управление и военн. безопасность", "чиновник": "Гос. управление и военн. безопасность",
+    "гостиниц": "Гостиницы и общепит", "общепит": "Гостиницы и общепит",
+    "недвижимост": "Операции с недвижимостью", "жкх": "Услуги ЖКХ", "спорт": "Спорт и досуг",
+}
+
+YEARS = ("2023", "2024")
+TOP_MARKERS = (
+    "топ", "самы", "самое", "самог", "самой", "самая", "самую", "рейтинг",
+    "наибол", "наимен", "лидер", "лучш", "худш", "перв",
+)
+ASC_MARKERS = ("наимен", "меньш", "худш", "низк", "беднейш", "минимал")
+DYNAMICS_MARKERS = ("динамик", "изменил", "изменени", "вырос", "снизил", "сократил", "тенденц", "тренд")
+# Вопросы, которые шаблоны не покрывают: отдаём агенту
+AGENT_MARKERS = (
+    "почему", "прогноз", "корреляц", "зависим", "причин", "доля", "долю", "процент",
+    "медиан", "расстоян", "километр", "возраст", "пенсион", "дети", "детей", "детск",
+    "мужчин", "женщин", "январ", "феврал", "март", "апрел", "июн", "июл", "август",
+    "сентябр", "октябр", "ноябр", "декабр", "квартал", "месяц",
+)
+AGENT_WORDS = {"май", "мая", "мае"}
+MAX_COMPARE = 5
+TOP_DEFAULT = 10
+TOP_MAX = 10  # правило 13 промпта NL2SQL: не больше 10 примеров
+
+
+class Intent(NamedTuple):
+    shape: str  # single | compare | top
+    metric: str
+    params: dict
+    territory_ids: List[int]
+    region: Optional[str]
+    limit: int
+    descending: bool
+
+
+def _has_stem(word: str, prefix: str) -> bool:
+    # Короткая основа («ед», «жкх») — только с падежным окончанием из гласных:
+    # «еду», «едой», но не «единый»
+    if len(prefix) >= MIN_STEM_LENGTH:
+        return word.startswith(prefix)
+    return re.fullmatch(re.escape(prefix) + r"[аеиоуыэюяй]{0,2}", word) is not None
+
+
+def _pick(words: List[str], mapping: Dict[str, str]) -> Optional[str]:
+    found = {value for word in words for prefix, value in mapping.items() if _has_stem(word, prefix)}
+    return found.pop() if len(found) == 1 else None
+
+
+class SQLTemplates:
+    """
+    Быстрый путь NL2SQL без ReAct-агента: вопросы вида «показатель МО за год»,
+    «топ-N МО по показателю» и «сравни МО» разбираются локально (метрика,
+    муниципалитеты, регион, годы) и выполняются готовыми параметризованными
+    запросами к сводным таблицам. Шаблон срабатывает, только если
+    муниципалитеты найдены однозначно; если вопрос не укладывается в шаблон,
+    match возвращает None, и работает агент.
+    """
+
+    def __init__(self, engine: Engine, index: MunicipalityIndex):
+        self._engine = engine
+        self._index = index
+        self._statements = {}
+        # Метрики
+        self.matched = 0
+        self.fallbacks = 0
+
+    def match(self, query: str, mentions: List[Mention], regions: List[str]) -> Optional[Intent]:
+        # Нечёткое или неоднозначное название («Новгорода») — шаблон уверенно
+        # ответил бы про другой МО, такие вопросы разбирает агент
+        if any(mention.fuzzy or mention.ambiguous for mention in mentions):
+            return None
+        words = tokenize(query)
+        mentioned = set()
+        for mention in mentions:
+            mentioned.update(range(mention.start, mention.end))
+        # Слова из названий МО не считаем признаками вопроса («Октябрьский» ≠ октябрь)
+        plain = [word for i, word in enumerate(words) if i not in mentioned]
+
+        if any(word.startswith(AGENT_MARKERS) or word in AGENT_WORDS for word in plain):
+            return None
+
+        metrics = [name for name, metric in METRICS.items()
+                   if any(word.startswith(metric.keywords) for word in plain)]
+        if metrics == ["market_access"] and not any(word.startswith(("рынк", "рынок", "рыноч")) for word in plain):
+            return None
+        if len(metrics) != 1:
+            return None
+        metric = metrics[0]
+
+        years = sorted({int(year) for year in re.findall(r"\b(20\d\d)\b", query)})
+        if any(str(year) not in YEARS for year in years):
+            return None
+        if not years and any(word.startswith(DYNAMICS_MARKERS) for word in plain):
+            years = [int(year) for year in YEARS]
+        if years and not METRICS[metric].years_sql:
+            return None
+
+        params = {}
+        if years:
+            params["years"] = years
+        # Без отрасли или категории шаблон не отвечает: фильтр «Все отрасли» /
+        # «Все категории» запрещён правилом 17 промпта NL2SQL, и ответ
+        # расходился бы с ответом агента на тот же вопрос
+        if metric == "salary":
+            params["okved"] = _pick(plain, OKVED)
+            if params["okved"] is None:
+                return None
+        if metric == "consumption":
+            params["category"] = _pick(plain, CATEGORIES)
+            if params["category"] is None:
+                return None
+
+        top = any(word.startswith(TOP_MARKERS) for word in plain)
+        descending = not any(word.startswith(ASC_MARKERS) for word in plain)
+        ids = [mention.municipality.territory_id for mention in mentions]
+
+        if top and not ids and len(regions) <= 1 and len(years) <= 1:
+            numbers = [int(n) for n in re.findall(r"\b(\d{1,2})\b", query)]
+            limit = min(numbers[0] if numbers else TOP_DEFAULT, TOP_MAX) or TOP_DEFAULT
+            return Intent("top", metric, params, [], regions[0] if regions else None, limit, descending)
+        if top or regions:
+            return None
+        if len(ids) == 1:
+            return Intent("single", metric, params, ids, None, 0, True)
+        if 2 <= len(ids) <= MAX_COMPARE:
+            return Intent("compare", metric, params, ids, None, 0, True)
+        return None
+
+    def _statement(self, intent: Intent):
+        # Текст запроса зависит только от формы вопроса — собираем его один раз
+        key = (intent.metric, intent.shape == "top", "years" in intent.params,
+               intent.region is not None, intent.descending)
+        statement = self._statements.get(key)
+        if statement is None:
+            metric = METRICS[intent.metric]
+            source = metric.years_sql if "years" in intent.params else metric.total_sql
+            if intent.shape == "top":
+                region = (" AND territory_id IN (SELECT territory_id FROM municipal_districts"
+                          " WHERE region_name = :region)") if intent.region else ""
+                order = "DESC" if intent.descending else "ASC"
+                sql = (f"SELECT territory_id, value, period FROM ({source}) s "
+                       f"WHERE value IS NOT NULL{region} ORDER BY value {order} LIMIT :limit")
+            else:
+                sql = (f"SELECT territory_id, value, period FROM ({source}) s "
+                       f"WHERE territory_id = ANY(:ids) ORDER BY territory_id, period")
+            statement = self._statements[key] = text(sql)
+        return statement
+
+    def _format(self, intent: Intent, rows) -> str:
+        metric = METRICS[intent.metric]
+        title = metric.title.format(**intent.params)
+        if intent.shape == "top":
+            where = f" в регионе {intent.region}" if intent.region else " по России"
+            order = "наибольшие" if intent.descending else "наименьшие"
+            title = title.rstrip(".") + f". Топ-{intent.limit}{where}, {order} значения"
+        lines = [title + ":"]
+
+        found = set()
+        for territory_id, value, period in rows:
+            found.add(territory_id)
+            municipality = self._index.get(territory_id)
+            name = f"{municipality.name} ({municipality.region})" if municipality else f"территория {territory_id}"
+            period = f", {period}" if period else ""
+            number = "нет данных" if value is None else f"{value:,.{metric.digits}f}".replace(",", " ")
+            lines.append(f"- {name}{period}: {number}")
+        for territory_id in intent.territory_ids:
+            if territory_id not in found:
+                municipality = self._index.get(territory_id)
+                lines.append(f"- {municipality.name if municipality else territory_id}: нет данных")
+        return "\n".join(lines)
+
+    def run(self, intent: Intent) -> Optional[str]:
+        params = dict(intent.params)
+        if intent.shape == "top":
+            params["limit"] = intent.limit
+            if intent.region:
+                params["region"] = intent.region
+        else:
+            params["ids"] = intent.territory_ids
+        try:
+            with self._engine.connect() as conn:
+                rows = conn.execute(self._statement(intent), params).all()
+        except SQLAlchemyError:
+            # Например, сводных таблиц нет — пусть отвечает агент
+            return None
+        if not rows:
+            return None
+        return self._format(intent, rows)
+
+    async def aanswer(self, query: str) -> Optional[str]:
+        """
+        Ответ по шаблону или None, если нужен агент.
+        """
+        mentions = await self._index.afind(query)
+        regions = await self._index.afind_regions(query)
+        intent = self.match(query, mentions, regions)
+        answer = await asyncio.to_thread(self.run, intent) if intent is not None else None
+        if answer is None:
+            self.fallbacks += 1
+        else:
+            self.matched += 1
+        return answer
+
+    def stats(self) -> dict:
+        return {
+            "matched_total": self.matched,
+            "fallback_total": self.fallbacks,
+        }
+
+
+sql_templates = SQLTemplates(nl2sql_engine, municipality_index)
@@ -0,0 +1,42 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Настройки читаются при импорте app.config; для тестов хватает значений
+# по умолчанию, без доступной базы тесты, которым она нужна, пропускаются
+os.environ.setdefault("POSTGRES_USER", "postgres")
+os.environ.setdefault("POSTGRES_PASSWORD", "postgres")
+os.environ.setdefault("POSTGRES_HOST", "127.0.0.1")
+os.environ.setdefault("POSTGRES_PORT", "5432")
+os.environ.setdefault("POSTGRES_DB", "postgres")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def pg_engine():
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import SQLAlchemyError
+
+    from app.config import settings
+
+    engine = create_engine(settings.get_db_url(), connect_args={"connect_timeout": 2})
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except SQLAlchemyError:
+        pytest.skip("PostgreSQL недоступен")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def stub_server():
+    from tests.stub_server import StubServer
+
+    server = StubServer()
+    yield server
+    server.close()
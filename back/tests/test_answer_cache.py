@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+from ml.answer_cache import AnswerCache
+
+
+class Version:
+    """DatasetVersion без базы: смена версии вызывает подписчиков из потока."""
+
+    def __init__(self):
+        self.value = "1"
+        self._listeners = []
+
+    def on_change(self, callback):
+        self._listeners.append(callback)
+
+    async def aget(self):
+        return self.value
+
+    def change(self, value):
+        self.value = value
+        for callback in self._listeners:
+            callback(value)
+
+
+def test_hit_after_put_for_normalized_question():
+    cache = AnswerCache(None, Version())
+
+    async def scenario():
+        await cache.aput("Население Самары?", "1 159 044")
+        return await cache.aget("население  самары")
+
+    assert asyncio.run(scenario()) == "1 159 044"
+    assert cache.stats()["hits_total"] == 1
+
+
+def test_version_change_from_another_thread_clears_cache():
+    version = Version()
+    cache = AnswerCache(None, version, max_size=8)
+
+    async def scenario():
+        stop = threading.Event()
+
+        def reload_dataset():
+            # Как DatasetVersion.refresh в asyncio.to_thread
+            number = 1
+            while not stop.is_set():
+                number += 1
+                version.change(str(number))
+
+        thread = threading.Thread(target=reload_dataset)
+        thread.start()
+        try:
+            for i in range(2000):
+                await cache.aput(f"вопрос {i}", "ответ")
+                await cache.aget(f"вопрос {i - 1}")
+        finally:
+            stop.set()
+            thread.join()
+
+        version.change("final")
+        return await cache.aget("вопрос 1999")
+
+    assert asyncio.run(scenario()) is None
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,14 @@
+from sqlalchemy import inspect, text
+
+from app.db import ensure_indexes
+
+
+def test_missing_model_index_is_created_on_existing_table(pg_engine):
+    with pg_engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_messages_session_id_timestamp"))
+
+    ensure_indexes(pg_engine)
+    ensure_indexes(pg_engine)  # повторный запуск ничего не ломает
+
+    indexes = {index["name"]: index["column_names"] for index in inspect(pg_engine).get_indexes("messages")}
+    assert indexes["ix_messages_session_id_timestamp"] == ["session_id", "timestamp"]
@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+import pytest
+
+from ml.fetcher import AsyncFetcher
+from ml.http_cache import HTTPCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HTTPCache(tmp_path / "http_cache.sqlite3", ttl=60)
+
+
+def make_fetcher(cache, retries=2):
+    return AsyncFetcher(
+        max_connections=4, per_host=2, retries=retries, timeout=5,
+        backoff_base=0.01, backoff_max=0.05, cache=cache,
+    )
+
+
+def fetch_times(fetcher, url, times):
+    async def run():
+        try:
+            return [await fetcher.fetch(url, deadline=asyncio.get_running_loop().time() + 5) for _ in range(times)]
+        finally:
+            await fetcher.aclose()
+    return asyncio.run(run())
+
+
+def test_not_modified_refreshes_entry(stub_server, cache):
+    fetcher = make_fetcher(cache)
+    url = stub_server.url + "/etag"
+    first, = fetch_times(fetcher, url, 1)
+    cache._ttl = 0
+
+    responses = fetch_times(fetcher, url, 2)
+
+    assert [response.text for response in responses] == [first.text] * 2
+    assert cache.stats() == {"hits_total": 0, "revalidated_total": 2, "misses_total": 1}
+    assert fetcher.stats()["failures_total"] == 0
+    assert stub_server.requests[-1][1]["If-None-Match"] == first.headers["ETag"]
+
+
+def test_stale_entry_is_served_on_server_error(stub_server, cache):
+    fetcher = make_fetcher(cache)
+    url = stub_server.url + "/etag"
+    first, = fetch_times(fetcher, url, 1)
+    cache._ttl = 0
+    stub_server.fail = True
+
+    response, = fetch_times(fetcher, url, 1)
+
+    assert response.text == first.text
+    assert fetcher.stats()["retries_total"] == 1
+    assert cache.stats()["hits_total"] == 1
+
+
+def test_server_error_is_retried_then_raised(stub_server, cache):
+    fetcher = make_fetcher(cache, retries=3)
+    stub_server.fail = True
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch_times(fetcher, stub_server.url + "/etag", 1)
+    assert len(stub_server.requests) == 3
+
+
+def test_client_error_is_raised_without_retries(stub_server, cache):
+    fetcher = make_fetcher(cache, retries=3)
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch_times(fetcher, stub_server.url + "/missing", 1)
+    assert len(stub_server.requests) == 1
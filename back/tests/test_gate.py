@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from ml.dataset import DatasetVersion
+from ml.gate import DomainVocabulary
+from ml.municipalities import Municipality, MunicipalityIndex
+
+
+ROWS = [
+    Municipality(1, "Арбат", "внутригородская территория города федерального значения", "Москва", 35000),
+    Municipality(2, "Казань", "городской округ город Казань", "Республика Татарстан", 1310000),
+    Municipality(3, "Пушкинский", "Пушкинский городской округ", "Московская область", 200000),
+    Municipality(4, "Чехов", "городской округ Чехов", "Московская область", 70000),
+    Municipality(5, "Ростов-на-Дону", "городской округ город Ростов-на-Дону", "Ростовская область", 1140000),
+    Municipality(6, "Ростовский", "Ростовский муниципальный округ", "Ярославская область", 58000),
+    Municipality(7, "Самара", "городской округ Самара", "Самарская область", 1160000),
+]
+
+
+@pytest.fixture
+def vocabulary():
+    index = MunicipalityIndex(None, DatasetVersion(None))
+    index.build(ROWS)
+    return DomainVocabulary(index)
+
+
+@pytest.mark.parametrize("query", [
+    "Кто такой Пушкин?",
+    "Что почитать из Чехова?",
+    "Посоветуй фильм про Москву",
+    "Какой рейтинг у фильма Матрица?",
+    "Лучший район для прогулок с собакой",
+])
+def test_off_topic_goes_to_llm(vocabulary, query):
+    assert not vocabulary.match(query)
+    assert not asyncio.run(vocabulary.amatch(query))
+
+
+@pytest.mark.parametrize("query", [
+    "Какая зарплата в Казани?",
+    "Численность населения Москвы",
+    "Сколько жителей в Чехове",
+    "население Ростова",
+    "зарплата в Ростове",
+    "зарплата в Самаре",
+    "Сравни население Самары и Ростова",
+])
+def test_metric_and_place_take_fast_path(vocabulary, query):
+    assert vocabulary.match(query)
+    assert asyncio.run(vocabulary.amatch(query))
+
+
+def test_metric_without_place_goes_to_llm(vocabulary):
+    assert not vocabulary.match("Что такое миграционный прирост?")
@@ -0,0 +1,65 @@
+import pytest
+
+from ml.agents import r
+from ml.http_cache import HTTPCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HTTPCache(tmp_path / "http_cache.sqlite3", ttl=60)
+
+
+def get(server, cache, path="/etag"):
+    return r.safe_request(server.url + path, params={"q": "население"}, max_retries=1, cache=cache)
+
+
+def test_fresh_hit_does_not_touch_network(stub_server, cache):
+    first = get(stub_server, cache)
+    second = get(stub_server, cache)
+
+    assert second.text == first.text
+    assert "первая версия" in second.text
+    assert len(stub_server.requests) == 1
+    assert cache.stats() == {"hits_total": 1, "revalidated_total": 0, "misses_total": 1}
+
+
+def test_fetch_document_parses_cached_page_offline(stub_server, cache):
+    r.fetch_document(stub_server.url + "/etag", cache=cache)
+    stub_server.close()
+
+    assert r.fetch_document(stub_server.url + "/etag", cache=cache)["text"] == "первая версия"
+
+
+def test_stale_entry_is_revalidated_with_etag(stub_server, cache):
+    first = get(stub_server, cache)
+    cache._ttl = 0
+
+    assert get(stub_server, cache).text == first.text
+    assert get(stub_server, cache).text == first.text
+    path, headers = stub_server.requests[-1]
+    assert headers["If-None-Match"] == first.headers["ETag"]
+    assert cache.stats()["revalidated_total"] == 2
+
+
+def test_changed_resource_replaces_entry(stub_server, cache):
+    get(stub_server, cache)
+    cache._ttl = 0
+    stub_server.body = "<html><main>вторая версия</main></html>"
+
+    assert "вторая версия" in get(stub_server, cache).text
+    cache._ttl = 60
+    assert "вторая версия" in get(stub_server, cache).text
+
+
+def test_stale_entry_is_served_on_error(stub_server, cache):
+    first = get(stub_server, cache)
+    cache._ttl = 0
+    stub_server.fail = True
+
+    assert get(stub_server, cache).text == first.text
+
+
+def test_error_without_entry_is_raised(stub_server, cache):
+    stub_server.fail = True
+    with pytest.raises(Exception):
+        get(stub_server, cache)
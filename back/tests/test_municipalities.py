@@ -0,0 +1,110 @@
+import pytest
+
+from ml.dataset import DatasetVersion
+from ml.municipalities import Municipality, MunicipalityIndex
+
+
+FEDERAL = "внутригородская территория города федерального значения"
+
+ROWS = [
+    Municipality(1, "Москворечье-Сабурово", FEDERAL, "Москва", 110000),
+    Municipality(2, "Арбат", FEDERAL, "Москва", 35000),
+    Municipality(3, "Адмиралтейский", FEDERAL, "Санкт-Петербург", 160000),
+    Municipality(4, "Василеостровский", FEDERAL, "Санкт-Петербург", 210000),
+    Municipality(5, "Гагаринский", FEDERAL, "Севастополь", 170000),
+    Municipality(6, "Питерский", "Питерский муниципальный район", "Саратовская область", 16000),
+    Municipality(7, "Уфа", "городской округ город Уфа", "Республика Башкортостан", 1160000),
+    Municipality(8, "Московский", "городской округ Московский", "Калининградская область", 5000),
+    Municipality(9, "Ростов-на-Дону", "городской округ город Ростов-на-Дону", "Ростовская область", 1140000),
+    Municipality(10, "Ростовский", "Ростовский муниципальный округ", "Ярославская область", 58000),
+    Municipality(11, "Нижний Новгород", "городской округ город Нижний Новгород", "Нижегородская область", 1230000),
+    Municipality(12, "Великий Новгород", "городской округ Великий Новгород", "Новгородская область", 225000),
+    Municipality(13, "Новгородский", "Новгородский муниципальный район", "Новгородская область", 60000),
+    Municipality(14, "Самара", "городской округ Самара", "Самарская область", 1160000),
+]
+
+
+@pytest.fixture
+def index():
+    index = MunicipalityIndex(None, DatasetVersion(None))
+    index.build(ROWS)
+    return index
+
+
+@pytest.mark.parametrize("name, region", [
+    ("Москве", "Москва"),
+    ("Москва", "Москва"),
+    ("МСК", "Москва"),
+    ("Санкт-Петербурге", "Санкт-Петербург"),
+    ("Петербург", "Санкт-Петербург"),
+    ("Питер", "Санкт-Петербург"),
+    ("СПб", "Санкт-Петербург"),
+    ("Севастополе", "Севастополь"),
+])
+def test_federal_city_resolves_to_region(index, name, region):
+    assert index.federal_city(name) == region
+    # Не подменяется одной внутригородской территорией
+    assert index.resolve(name) == []
+
+
+def test_federal_city_territories(index):
+    assert sorted(index.territories("Москва")) == [1, 2]
+    assert sorted(index.territories("Санкт-Петербург")) == [3, 4]
+
+
+def test_federal_alias_does_not_swallow_longer_names(index):
+    assert index.federal_city("Питерский") is None
+    assert index.federal_city("Московский") is None
+    assert index.resolve("Питерский")[0][0].territory_id == 6
+
+
+def test_federal_city_found_as_region_in_question(index):
+    question = "Какая зарплата в Питере?"
+    assert index.find_regions(question) == ["Санкт-Петербург"]
+    assert index.find(question) == []
+    assert index.find_regions("Население Москвы и Уфы") == ["Москва"]
+
+
+def test_fuzzy_match_still_works(index):
+    assert index.resolve("Уфе")[0][0].name == "Уфа"
+
+
+def names(mentions):
+    return [mention.municipality.name for mention in mentions]
+
+
+@pytest.mark.parametrize("query", ["население Ростова", "зарплата в Ростове", "миграция в Ростовом"])
+def test_inflected_name_without_rest_of_name(index, query):
+    mentions = index.find(query)
+    assert names(mentions) == ["Ростов-на-Дону"]
+    assert not mentions[0].fuzzy and not mentions[0].ambiguous
+
+
+def test_main_word_prefers_city_over_adjective_name(index):
+    assert names(index.find("сравни население Самары и Ростова")) == ["Самара", "Ростов-на-Дону"]
+    assert names(index.find("население в Ростовском")) == ["Ростовский"]
+
+
+def test_main_word_shared_by_several_names_is_ambiguous(index):
+    mentions = index.find("население Новгорода")
+    assert names(mentions) == ["Нижний Новгород"]
+    assert mentions[0].ambiguous
+    assert names(index.find("население Великого Новгорода")) == ["Великий Новгород"]
+    assert not index.find("население Великого Новгорода")[0].ambiguous
+
+
+def test_find_and_resolve_agree(index):
+    assert index.resolve("Ростова")[0][0].name == "Ростов-на-Дону"
+    assert index.resolve("Новгорода")[0][0].name == "Нижний Новгород"
+
+
+def test_federal_cities_on_dataset(pg_engine):
+    index = MunicipalityIndex(pg_engine, DatasetVersion(pg_engine))
+    if index.territories("Москва") == []:
+        pytest.skip("датасет не загружен")
+    assert len(index.territories("Москва")) > 100
+    assert index.federal_city("Санкт-Петербурге") == "Санкт-Петербург"
+    assert index.resolve("Москве") == []
+    assert index.resolve("Питер") == []
+    assert names(index.find("население Ростова")) == ["Ростов-на-Дону"]
+    assert names(index.find("население Новгорода")) != ["Новгородский"]
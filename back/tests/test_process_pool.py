@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.hashing import PasswordHasher
+from app.process_pool import BoundedProcessPool, ProcessPoolFull
+from ml.pdf import PDFExtractor, PDFQueueFull
+
+
+def test_runs_in_worker_process():
+    pool = BoundedProcessPool(workers=1, max_pending=2)
+    try:
+        assert asyncio.run(pool.run(pow, 2, 10)) == 1024
+    finally:
+        pool.shutdown()
+
+
+def test_rejects_over_max_pending():
+    pool = BoundedProcessPool(workers=1, max_pending=0)
+    with pytest.raises(ProcessPoolFull):
+        asyncio.run(pool.run(pow, 2, 10))
+
+
+def test_overload_is_mapped_by_callers():
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(PasswordHasher(workers=1, max_pending=0, retry_after=3).hash("secret"))
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "3"
+
+    with pytest.raises(PDFQueueFull):
+        asyncio.run(PDFExtractor(workers=1, max_pending=0, max_pages=1, max_chars=1).extract(b""))
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes():
+    pool = BoundedProcessPool(workers=1, max_pending=1)
+
+    async def scenario():
+        await pool.run(pow, 2, 1)  # процесс уже запущен
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.run(time.sleep, 1), 0.2)
+        # Задача ещё выполняется в процессе — новая сверх предела не принимается
+        assert pool.pending == 1
+        with pytest.raises(ProcessPoolFull):
+            await pool.run(pow, 2, 10)
+
+        deadline = time.monotonic() + 10
+        while pool.pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        assert await pool.run(pow, 2, 10) == 1024
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
@@ -0,0 +1,86 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from ml import retrieval
+from ml.retrieval import CHUNKS_FILE, EMBEDDING_DIM, META_FILE, Chunk, RetrievalIndex, build_index
+
+
+CHUNKS = [
+    Chunk("salary.md", "Зарплаты", "Средняя зарплата учителей выросла в 2024 году."),
+    Chunk("population.md", "Население", "Численность населения города сократилась за год."),
+    Chunk("transport.md", "Транспорт", "Автобусы и трамваи перевозят жителей города."),
+    Chunk("salary2.md", "Зарплаты врачей", "Зарплата врачей, зарплата медсестёр и зарплата санитаров."),
+]
+
+
+def test_bm25_scores_matching_chunks_by_term_frequency():
+    index = RetrievalIndex.from_chunks(CHUNKS)
+    scores = index._bm25("зарплата")
+    assert scores[1] == scores[2] == 0
+    assert scores[3] > scores[0] > 0
+    assert not index._bm25("космодром").any()
+
+
+def test_search_ranks_lexical_match_first():
+    results = RetrievalIndex.from_chunks(CHUNKS).search("численность населения", k=2)
+    assert results[0].chunk.source == "population.md"
+
+
+def test_fusion_prefers_chunks_found_by_both_rankings(monkeypatch):
+    index = RetrievalIndex.from_chunks(CHUNKS)
+    # BM25: 0, 1, 3; векторы: 1, 2, 3 (у 0 близость ниже DENSE_MIN_SCORE)
+    monkeypatch.setattr(index, "_bm25", lambda query: np.array([3.0, 2.0, 0.0, 1.0], dtype=np.float32))
+    unit = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    unit[0] = 1.0
+    monkeypatch.setattr(retrieval, "embed", lambda texts: unit[None, :])
+    vectors = np.zeros((len(CHUNKS), EMBEDDING_DIM), dtype=np.float32)
+    vectors[:, 0] = [0.0, 0.9, 0.8, 0.5]
+    index._vectors = vectors
+
+    results = index.search("что угодно", k=4)
+    assert [result.chunk.source for result in results] == [
+        "population.md", "salary2.md", "salary.md", "transport.md",
+    ]
+    assert results[0].score == round(1 / 62 + 1 / 61, 4)
+
+
+def test_build_and_load_round_trip(tmp_path):
+    assert build_index(CHUNKS, tmp_path) == len(CHUNKS)
+    index = RetrievalIndex(tmp_path)
+    results = index.search("зарплата врачей", k=3)
+
+    assert isinstance(index._vectors, np.memmap)
+    assert index.stats()["chunks"] == len(CHUNKS)
+    assert results == RetrievalIndex.from_chunks(CHUNKS).search("зарплата врачей", k=3)
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_missing_index_returns_nothing(tmp_path, monkeypatch):
+    index = RetrievalIndex(tmp_path / "rag_index")
+    assert index.search("зарплата") == []
+    assert index.stats()["chunks"] == 0
+
+    monkeypatch.setattr(retrieval, "retrieval_index", index)
+    assert retrieval.rag_sys("зарплата") == ""
+
+
+def test_unfinished_index_is_not_opened(tmp_path):
+    build_index(CHUNKS, tmp_path)
+    (tmp_path / META_FILE).unlink()
+    assert (tmp_path / CHUNKS_FILE).exists()
+    assert RetrievalIndex(tmp_path).search("зарплата") == []
+
+
+def test_rag_agent_skips_llm_without_context(monkeypatch):
+    RAG = pytest.importorskip("ml.agents.RAG")
+
+    class NoLLM:
+        async def ainvoke(self, messages):
+            raise AssertionError("LLM вызван без контекста")
+
+    monkeypatch.setattr(RAG, "rag_sys", lambda query: "")
+    monkeypatch.setattr(RAG, "llm", NoLLM())
+    state = {"messages": [{"role": "user", "content": "Что нового в Самаре?"}]}
+    assert asyncio.run(RAG.rag_agent(state)) == {"web_search_context": ""}
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from app.scheduler import FairScheduler
+
+
+async def wait_in_queue(scheduler, user_id, admitted):
+    async with scheduler.slot(user_id):
+        admitted.append(user_id)
+        await asyncio.sleep(0)
+
+
+def test_waiter_cancelled_while_slot_is_released():
+    async def run():
+        scheduler = FairScheduler(max_concurrency=1, max_queue=10)
+        holder = scheduler.slot(1)
+        await holder.__aenter__()
+
+        admitted = []
+        cancelled = asyncio.create_task(wait_in_queue(scheduler, 2, admitted))
+        waiting = asyncio.create_task(wait_in_queue(scheduler, 3, admitted))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queue_depth"] == 2
+
+        # Отмена ожидания и освобождение слота в одном шаге цикла событий:
+        # обработчик CancelledError в slot() ещё не выполнился
+        cancelled.cancel()
+        await holder.__aexit__(None, None, None)
+
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        await waiting
+        assert admitted == [3]
+        assert scheduler.stats()["running"] == 0
+        assert scheduler.stats()["queue_depth"] == 0
+
+        # Ёмкость не потеряна: слот снова выдаётся сразу
+        await asyncio.wait_for(wait_in_queue(scheduler, 4, admitted), timeout=1)
+        assert admitted == [3, 4]
+
+    asyncio.run(run())
+
+
+def test_round_robin_between_users():
+    async def run():
+        scheduler = FairScheduler(max_concurrency=1, max_queue=10)
+        holder = scheduler.slot(0)
+        await holder.__aenter__()
+
+        admitted = []
+        tasks = [asyncio.create_task(wait_in_queue(scheduler, user_id, admitted)) for user_id in (1, 1, 1, 2)]
+        await asyncio.sleep(0)
+        await holder.__aexit__(None, None, None)
+        await asyncio.gather(*tasks)
+        assert admitted == [1, 2, 1, 1]
+
+    asyncio.run(run())
+
+
+def test_full_queue_is_rejected():
+    async def run():
+        scheduler = FairScheduler(max_concurrency=1, max_queue=1)
+        holder = scheduler.slot(0)
+        await holder.__aenter__()
+        queued = asyncio.create_task(wait_in_queue(scheduler, 1, []))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Exception) as error:
+            scheduler.check()
+        assert error.value.status_code == 429
+
+        await holder.__aexit__(None, None, None)
+        await queued
+
+    asyncio.run(run())
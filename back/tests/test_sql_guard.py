@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from ml import sql_tools
+from ml.sql_cache import sql_result_cache
+from ml.sql_guard import GuardedSQLExecutor
+from tests.test_sql_tools import make_tools
+
+
+def error_of(result: str) -> str:
+    assert result.startswith("Error: ")
+    return json.loads(result[len("Error: "):])["error"]
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    sql_result_cache.clear()
+
+
+@pytest.mark.parametrize("query", [
+    "DELETE FROM municipal_districts",
+    "UPDATE municipal_districts SET region_name = ''",
+    "DROP TABLE municipal_districts",
+])
+def test_agent_query_tool_rejects_dml(query):
+    assert error_of(make_tools()["sql_db_query"].run(query)) == "not_select"
+
+
+def test_agent_query_tool_rejects_multiple_statements():
+    result = make_tools()["sql_db_query"].run("SELECT 1; DELETE FROM municipal_districts")
+    assert error_of(result) == "multiple_statements"
+
+
+def test_agent_query_tool_checks_cost(monkeypatch, pg_engine):
+    guard = GuardedSQLExecutor(pg_engine, statement_timeout=5000, max_cost=10, max_rows=5)
+    monkeypatch.setattr(sql_tools, "sql_guard", guard)
+    tool = make_tools()["sql_db_query"]
+
+    expensive = "SELECT count(*) FROM generate_series(1, 1000000) a, generate_series(1, 1000) b"
+    assert error_of(tool.run(expensive)) == "cost_limit"
+    assert guard.rejected == 1
+
+
+def test_agent_query_tool_is_read_only_and_capped(monkeypatch, pg_engine):
+    guard = GuardedSQLExecutor(pg_engine, statement_timeout=5000, max_cost=1e9, max_rows=5)
+    monkeypatch.setattr(sql_tools, "sql_guard", guard)
+    tool = make_tools()["sql_db_query"]
+
+    result = tool.run("SELECT i FROM generate_series(1, 50) i")
+    assert result.startswith("[(1,), (2,), (3,), (4,), (5,)]")
+    assert "only the first 5 rows" in result
+
+    # DML внутри CTE проходит проверку первого слова, но транзакция read-only
+    writing = "WITH t AS (INSERT INTO dataset_meta (key, value) VALUES ('guard_test', '1') RETURNING 1) SELECT * FROM t"
+    result = tool.run(writing)
+    assert error_of(result) == "sql_error"
+    assert "read-only" in result
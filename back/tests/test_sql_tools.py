@@ -0,0 +1,29 @@
+from langchain_community.utilities import SQLDatabase
+from langchain_core.language_models.fake import FakeListLLM
+from sqlalchemy import create_engine
+
+from ml import sql_tools
+from ml.sql_cache import sql_result_cache
+from ml.sql_tools import CachedQuerySQLDatabaseTool, build_sql_tools
+
+
+def make_tools():
+    db = SQLDatabase(create_engine("sqlite://"))
+    return {tool.name: tool for tool in build_sql_tools(db, FakeListLLM(responses=["SELECT 1"]))}
+
+
+def test_query_tool_is_replaced():
+    tools = make_tools()
+    assert type(tools["sql_db_query"]) is CachedQuerySQLDatabaseTool
+    assert set(tools) == {"sql_db_query", "sql_db_schema", "sql_db_list_tables", "sql_db_query_checker"}
+
+
+def test_query_tool_uses_result_cache(monkeypatch):
+    calls = []
+    monkeypatch.setattr(sql_tools.sql_guard, "run", lambda query: calls.append(query) or "[(1,)]")
+    sql_result_cache.clear()
+    tool = make_tools()["sql_db_query"]
+
+    assert tool.run("SELECT 42 AS answer_for_cache_test") == "[(1,)]"
+    assert tool.run("select  42 as answer_for_cache_test;") == "[(1,)]"
+    assert len(calls) == 1
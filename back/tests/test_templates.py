@@ -0,0 +1,113 @@
+import pytest
+from sqlalchemy import text
+
+from ml.dataset import DatasetVersion
+from ml.municipalities import Municipality, MunicipalityIndex
+from ml.templates import SQLTemplates
+
+
+ROWS = [
+    Municipality(1, "Ростов-на-Дону", "городской округ город Ростов-на-Дону", "Ростовская область", 1140000),
+    Municipality(2, "Ростовский", "Ростовский муниципальный округ", "Ярославская область", 58000),
+    Municipality(3, "Самара", "городской округ Самара", "Самарская область", 1160000),
+    Municipality(4, "Нижний Новгород", "городской округ город Нижний Новгород", "Нижегородская область", 1230000),
+    Municipality(5, "Великий Новгород", "городской округ Великий Новгород", "Новгородская область", 225000),
+    Municipality(6, "Таганрог", "городской округ город Таганрог", "Ростовская область", 240000),
+    Municipality(7, "Уфа", "городской округ город Уфа", "Республика Башкортостан", 1160000),
+]
+
+
+@pytest.fixture
+def index():
+    index = MunicipalityIndex(None, DatasetVersion(None))
+    index.build(ROWS)
+    return index
+
+
+@pytest.fixture
+def match(index):
+    templates = SQLTemplates(None, index)
+
+    def match(query):
+        return templates.match(query, index.find(query), index.find_regions(query))
+
+    return match
+
+
+def test_single(match):
+    intent = match("население Ростова")
+    assert intent.shape == "single"
+    assert intent.metric == "population"
+    assert intent.territory_ids == [1]
+    assert intent.params == {}
+
+
+def test_compare_with_industry_and_year(match):
+    intent = match("Сравни зарплату учителей в Самаре и Таганроге в 2024 году")
+    assert intent.shape == "compare"
+    assert intent.metric == "salary"
+    assert intent.territory_ids == [3, 6]
+    assert intent.params == {"okved": "Образование", "years": [2024]}
+
+
+def test_top_in_region(match):
+    intent = match("Топ-5 городов с наименьшей миграцией в Ростовской области")
+    assert intent.shape == "top"
+    assert intent.metric == "migration"
+    assert intent.region == "Ростовская область"
+    assert intent.limit == 5
+    assert not intent.descending
+
+
+@pytest.mark.parametrize("word", ["еда", "еду", "еды", "едой"])
+def test_category_inflections(match, word):
+    intent = match(f"Траты на {word} в Самаре")
+    assert intent.metric == "consumption"
+    assert intent.params == {"category": "Продовольствие"}
+
+
+@pytest.mark.parametrize("query", [
+    # Без отрасли или категории — правило 17 промпта, отвечает агент
+    "Средняя зарплата в Самаре",
+    "Траты жителей Самары",
+    # Неоднозначное и нечёткое название
+    "Население Новгорода",
+    "Население города Уфв",
+    # Вопросы не по шаблону
+    "Почему в Самаре растёт население",
+    "Население Самары в 2019 году",
+    "Зарплата и население Самары",
+])
+def test_falls_back_to_agent(match, query):
+    assert match(query) is None
+
+
+@pytest.fixture
+def dataset(pg_engine):
+    with pg_engine.connect() as conn:
+        if not conn.execute(text("SELECT to_regclass('salary_avg')")).scalar():
+            pytest.skip("датасет не загружен")
+    index = MunicipalityIndex(pg_engine, DatasetVersion(pg_engine))
+    return index, SQLTemplates(pg_engine, index)
+
+
+def test_top_query_on_dataset(dataset):
+    index, templates = dataset
+    query = "Топ-3 по численности населения в Ростовской области"
+    intent = templates.match(query, index.find(query), index.find_regions(query))
+    answer = templates.run(intent)
+    lines = answer.splitlines()
+    assert len(lines) == 4
+    assert "Топ-3 в регионе Ростовская область" in lines[0]
+    assert lines[1].startswith("- Ростов-на-Дону (Ростовская область)")
+
+
+def test_compare_query_on_dataset(dataset):
+    index, templates = dataset
+    query = "Сравни зарплату учителей в Самаре и Ростове за 2023 и 2024"
+    intent = templates.match(query, index.find(query), index.find_regions(query))
+    assert intent.params == {"okved": "Образование", "years": [2023, 2024]}
+    answer = templates.run(intent)
+    assert "отрасль: Образование" in answer
+    assert sum(line.startswith("- Самара") for line in answer.splitlines()) == 2
+    assert sum(line.startswith("- Ростов-на-Дону") for line in answer.splitlines()) == 2
@@ -0,0 +1,37 @@
+import pytest
+
+from app import tokens
+from app.config import settings
+
+
+def test_round_trip():
+    assert tokens.verify_access_token(tokens.create_access_token(7)) == 7
+
+
+def test_tampered_and_expired_tokens_are_rejected():
+    payload, signature = tokens.create_access_token(7).split(".")
+    assert tokens.verify_access_token(f"{payload}.{signature[:-1]}A") is None
+    assert tokens.verify_access_token(payload) is None
+    assert tokens.verify_access_token(tokens.create_access_token(7, ttl=-10)) is None
+
+
+@pytest.mark.parametrize("token", ["абв.где", "eyJzdWIiOjF9.подпись", "x.éé"])
+def test_non_ascii_token_is_rejected(token):
+    assert tokens.verify_access_token(token) is None
+
+
+def test_token_is_valid_in_another_process_with_same_key(monkeypatch):
+    token = tokens.create_access_token(7)
+    monkeypatch.setattr(settings, "SECRET_KEY", "other-secret")
+    assert tokens.verify_access_token(token) is None
+    monkeypatch.setattr(settings, "SECRET_KEY", "test-secret")
+    assert tokens.verify_access_token(token) == 7
+
+
+def test_no_tokens_without_secret_key(monkeypatch):
+    token = tokens.create_access_token(7)
+    monkeypatch.setattr(settings, "SECRET_KEY", "")
+    assert not tokens.tokens_enabled()
+    assert tokens.verify_access_token(token) is None
+    with pytest.raises(RuntimeError):
+        tokens.create_access_token(7)
@@ -1,5 +1,6 @@
 import pandas as pd
-from sqlalchemy import create_engine
+from datetime import datetime, timezone
+from sqlalchemy import Float, Integer, SmallInteger, String, create_engine, text
 from sqlalchemy.engine import URL
 from os import environ
 
@@ -26,6 +27,63 @@ tables = [
     "consumption",
 ]
 
+# Явные типы колонок вместо выведенных pandas
+dtypes = {
+    "market_access": {
+        "territory_id": Integer(),
+        "market_access": Float(),
+    },
+    "bdmo_population": {
+        "territory_id": Integer(),
+        "year": SmallInteger(),
+        "period": String(),
+        "age": String(),
+        "gender": String(),
+        "value": Float(),
+    },
+    "bdmo_migration": {
+        "territory_id": Integer(),
+        "year": SmallInteger(),
+        "period": String(),
+        "age": String(),
+        "gender": String(),
+        "value": Float(),
+    },
+    "bdmo_salary": {
+        "territory_id": Integer(),
+        "year": SmallInteger(),
+        "period": String(),
+        "okved_name": String(),
+        "okved_letter": String(),
+        "value": Float(),
+    },
+    "connection": {
+        "territory_id_x": Integer(),
+        "territory_id_y": Integer(),
+        "distance": Float(),
+    },
+    "consumption": {
+        "date": String(7),  # YYYY-MM
+        "territory_id": Integer(),
+        "category": String(),
+        "value": Float(),
+    },
+    "municipal_districts": {
+        "territory_id": Integer(),
+    },
+}
+
+# Индексы под фильтры агента: территория, год, период/месяц
+indexes = {
+    "market_access": [("territory_id",)],
+    "bdmo_population": [("territory_id", "year", "age"), ("year", "age")],
+    "bdmo_migration": [("territory_id", "year", "age"), ("year", "age")],
+    "bdmo_salary": [("territory_id", "year", "period"), ("year", "period", "okved_name")],
+    "connection": [("territory_id_x",), ("territory_id_y",)],
+    "consumption": [("territory_id", "date"), ("date", "category")],
+    "municipal_districts": [("territory_id",), ("municipal_district_name_short",)],
+}
+
 url = URL.create(
     drivername="postgresql",
     username=USERNAME,
@@ -40,11 +98,121 @@ engine = create_engine(url)
 for file, table in zip(files, tables):
     try:
         df = pd.read_parquet(file, engine="fastparquet")
-        df.to_sql(table, engine, if_exists="replace", index=False)
+        df.to_sql(table, engine, if_exists="replace", index=False, dtype=dtypes.get(table))
     except:
         print(file, "was not processed")
 
 excel_file = "t_dict_municipal_districts.xlsx"
 table = "municipal_districts"
 df = pd.read_excel(excel_file, sheet_name="Sheet1")
-df.to_sql(table, engine, if_exists="replace", index=False)
+df.to_sql(table, engine, if_exists="replace", index=False, dtype=dtypes.get(table))
+
+for table, columns_list in indexes.items():
+    for columns in columns_list:
+        name = f"ix_{table}_{'_'.join(columns)}"
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        except Exception:
+            print(name, "was not created")
+
+# Сводные таблицы для типовых вопросов NL2SQL (период по умолчанию — 2023–2024).
+# Обычные таблицы, а не материализованные представления: to_sql(if_exists="replace")
+# не смог бы удалить исходную таблицу, от которой зависит представление
+# В bdmo_salary периоды нарастающие («январь-март» … «январь-декабрь»),
+# поэтому за год берётся только самый полный период, а не среднее по всем
+salary_latest_period = """
+    SELECT territory_id, year, period, okved_name, okved_letter, value
+    FROM (
+        SELECT territory_id, year, period, okved_name, okved_letter, value,
+            RANK() OVER (
+                PARTITION BY territory_id, year, okved_name, okved_letter
+                ORDER BY CASE period
+                    WHEN 'январь-декабрь' THEN 12 WHEN 'январь-сентябрь' THEN 9
+                    WHEN 'январь-июнь' THEN 6 WHEN 'январь-март' THEN 3 ELSE 0
+                END DESC
+            ) AS period_rank
+        FROM bdmo_salary
+    ) ranked
+    WHERE period_rank = 1
+"""
+
+summaries = {
+    # Средняя зарплата по МО и отрасли за каждый год и за весь период
+    "salary_avg_year": f"""
+        SELECT territory_id, year, period, okved_name, okved_letter, AVG(value) AS avg_salary
+        FROM ({salary_latest_period}) latest
+        GROUP BY territory_id, year, period, okved_name, okved_letter
+    """,
+    "salary_avg": f"""
+        SELECT territory_id, okved_name, okved_letter, AVG(value) AS avg_salary
+        FROM ({salary_latest_period}) latest
+        WHERE year BETWEEN 2023 AND 2024
+        GROUP BY territory_id, okved_name, okved_letter
+    """,
+    # Средние безналичные траты на одного жителя в месяц (не сумма)
+    "consumption_avg_year": """
+        SELECT territory_id, CAST(LEFT(date, 4) AS INTEGER) AS year, category, CAST(AVG(value) AS DOUBLE PRECISION) AS avg_value
+        FROM consumption
+        GROUP BY territory_id, LEFT(date, 4), category
+    """,
+    "consumption_avg": """
+        SELECT territory_id, category, CAST(AVG(value) AS DOUBLE PRECISION) AS avg_value
+        FROM consumption
+        WHERE date BETWEEN '2023-01' AND '2024-12'
+        GROUP BY territory_id, category
+    """,
+    # Население (агломерация) за последний доступный год, все возрасты
+    "population_latest": """
+        SELECT DISTINCT ON (territory_id) territory_id, year, population
+        FROM (
+            SELECT territory_id, year, SUM(value) AS population
+            FROM (
+                SELECT territory_id, year, gender, AVG(value) AS value
+                FROM bdmo_population
+                WHERE age = 'Всего'
+                GROUP BY territory_id, year, gender
+            ) by_gender
+            GROUP BY territory_id, year
+        ) by_year
+        ORDER BY territory_id, year DESC
+    """,
+    # Миграционный прирост по МО и году, все возрасты и оба пола
+    "migration_balance": """
+        SELECT territory_id, year, SUM(value) AS balance
+        FROM bdmo_migration
+        WHERE age = 'Всего'
+        GROUP BY territory_id, year
+    """,
+}
+
+for table, query in summaries.items():
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+            conn.execute(text(f"CREATE TABLE {table} AS {query}"))
+            conn.execute(text(f"CREATE INDEX ON {table} (territory_id)"))
+    except Exception:
+        print(table, "was not built")
+
+# Свежая статистика для планировщика после полной перезаливки
+with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+    conn.execute(text("ANALYZE"))
+
+# Новая версия датасета: бэкенд сбрасывает по ней кэши ответов
+version = datetime.now(timezone.utc).isoformat()
+with engine.begin() as conn:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS dataset_meta (key VARCHAR PRIMARY KEY, value VARCHAR NOT NULL)"
+    ))
+    conn.execute(
+        text(
+            "INSERT INTO dataset_meta (key, value) VALUES ('version', :version) "
+            "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value"
+        ),
+        {"version": version},
+    )
+    # Явная инвалидация общего кэша ответов
+    if conn.execute(text("SELECT to_regclass('answer_cache')")).scalar():
+        conn.execute(text("TRUNCATE answer_cache"))
+print("dataset version", version)
@@ -6,6 +6,63 @@ const createAuthHeader = (email: string, password: string) => {
   return `Basic ${token}`;
 };
 
+// Токен доступа из /api/login: бэкенд проверяет его без bcrypt
+let accessToken: { email: string; token: string; expiresAt: number } | null =
+  null;
+
+export const getAuthHeader = async (email: string, password: string) => {
+  if (
+    !accessToken ||
+    accessToken.email !== email ||
+    accessToken.expiresAt <= Date.now()
+  ) {
+    try {
+      const response = await axios.post(`${BACKEND_URL}/api/login`, null, {
+        headers: {
+          Authorization: createAuthHeader(email, password),
+        },
+      });
+      if (!response.data.access_token) {
+        // Бэкенд без SECRET_KEY токены не выдаёт
+        return createAuthHeader(email, password);
+      }
+      accessToken = {
+        email,
+        token: response.data.access_token,
+        // Обновляем токен за минуту до истечения
+        expiresAt: Date.now() + (response.data.expires_in - 60) * 1000,
+      };
+    } catch {
+      // Не удалось получить токен — работаем через Basic, как раньше
+      return createAuthHeader(email, password);
+    }
+  }
+  return `Bearer ${accessToken.token}`;
+};
+
+// Запрос с токеном; если бэкенд отверг токен (401: истёк, перезапуск,
+// другой SECRET_KEY) — сбрасываем его и повторяем один раз через Basic
+export const withAuth = async <T>(
+  email: string,
+  password: string,
+  request: (authorization: string) => Promise<T>
+): Promise<T> => {
+  const authorization = await getAuthHeader(email, password);
+  try {
+    return await request(authorization);
+  } catch (error: unknown) {
+    if (
+      authorization.startsWith("Bearer ") &&
+      axios.isAxiosError(error) &&
+      error.response?.status === 401
+    ) {
+      accessToken = null;
+      return request(createAuthHeader(email, password));
+    }
+    throw error;
+  }
+};
+
 export const loginFetch = async (email: string, password: string) => {
   try {
     const response = await axios.post(`${BACKEND_URL}/api/login`, null, {
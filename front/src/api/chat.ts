@@ -1,13 +1,8 @@
 import axios from "axios";
+import { withAuth } from "./auth";
 
 const BACKEND_URL = import.meta.env.VITE_BASE_URL;
 
-// eslint-disable-next-line react-hooks/rules-of-hooks
-const createAuthHeader = (email: string, password: string) => {
-  const token = btoa(`${email}:${password}`);
-  return `Basic ${token}`;
-};
-
 export const sendMessage = async (
   content: string,
   email: string,
@@ -16,17 +11,19 @@ export const sendMessage = async (
   console.log(content);
   try {
     console.log(BACKEND_URL);
-    const response = await axios.post(
-      `${BACKEND_URL}/api/quest`,
-      {
-        text: content,
-      },
-      {
-        headers: {
-          "Content-type": "application/json",
-          Authorization: createAuthHeader(email, password),
+    const response = await withAuth(email, password, (authorization) =>
+      axios.post(
+        `${BACKEND_URL}/api/quest`,
+        {
+          text: content,
         },
-      }
+        {
+          headers: {
+            "Content-type": "application/json",
+            Authorization: authorization,
+          },
+        }
+      )
     );
     return response.data;
   } catch (error: unknown) {
@@ -40,16 +37,27 @@ export const sendMessage = async (
 
 export const getChats = async (email: string, password: string) => {
   try {
-    const response = await axios.post(
-      `${BACKEND_URL}/api/hist`,
-      {},
-      {
-        headers: {
-          Authorization: createAuthHeader(email, password),
-        },
-      }
-    );
-    return response.data;
+    // /api/hist отдаёт чаты страницами, следующая — по курсору X-Next-Cursor
+    const chats = [];
+    let cursor: string | undefined;
+    do {
+      const before = cursor;
+      const response = await withAuth(email, password, (authorization) =>
+        axios.post(
+          `${BACKEND_URL}/api/hist`,
+          {},
+          {
+            params: before ? { before } : {},
+            headers: {
+              Authorization: authorization,
+            },
+          }
+        )
+      );
+      chats.push(...response.data);
+      cursor = response.headers["x-next-cursor"];
+    } while (cursor);
+    return chats;
   } catch (error: unknown) {
     if (axios.isAxiosError(error)) {
       throw new Error(error.message);
@@ -68,17 +76,19 @@ export const createChatFetch = async (
     console.log("Creating chat with title:", title);
     console.log("Using email for authentication:", email, password); // Логируем email
 
-    const response = await axios.post(
-      `${BACKEND_URL}/api/hist-create`,
-      {
-        title: title,
-      },
-      {
-        headers: {
-          "Content-Type": "application/json",
-          Authorization: createAuthHeader(email, password),
+    const response = await withAuth(email, password, (authorization) =>
+      axios.post(
+        `${BACKEND_URL}/api/hist-create`,
+        {
+          title: title,
         },
-      }
+        {
+          headers: {
+            "Content-Type": "application/json",
+            Authorization: authorization,
+          },
+        }
+      )
     );
 
     console.log("Chat created successfully:", response.data); // Логируем успешный ответ